@@ -12,8 +12,11 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 from typing import Sequence, Tuple
+import functools
 import math
 
+import numpy as np
+
 from phyre.creator import constants
 from phyre.creator import shapes as shapes_lib
 from phyre.interface.scene import ttypes as scene_if
@@ -27,7 +30,14 @@ class TaskCreator(object):
     SolutionTier = constants.SolutionTier
 
     def __init__(self):
+        self.reset()
+
+    def reset(self):
+        """Starts a new task with an empty scene with walls.
 
+        The previously built task is not modified and could be kept by the
+        caller.
+        """
         # Create empty scene and task.
         self.scene = scene_if.Scene(bodies=[])
         self.scene.width = constants.SCENE_WIDTH
@@ -39,6 +49,8 @@ class TaskCreator(object):
                                  phantomShape=None)
         self.set_meta(self.SolutionTier.GENERAL)
         self.body_list = []
+        # Whether each body in body_list is a bounding wall.
+        self._is_wall = []
 
         # Build the bounding walls.
         self.bottom_wall = self._add_wall('bottom')
@@ -70,6 +82,8 @@ class TaskCreator(object):
             body.set_left(self.scene.width).set_bottom(0)
         else:
             raise ValueError('Unknown wall side: %s' % side)
+        # The wall box was just registered, so it is the last body.
+        self._is_wall[-1] = True
         return body
 
     def add(self, string_arg, scale=0.5, **set_kwargs):
@@ -112,8 +126,9 @@ class TaskCreator(object):
                            dynamic: bool = True):
         # Make sure the center mass is at zero. That makes rendering more precise.
 
+        vertices = np.asarray(vertices, dtype=np.float64)
         (center_x, center_y), _ = shapes_lib.compute_polygon_centroid(vertices)
-        vertices = [(x - center_x, y - center_y) for x, y in vertices]
+        vertices = (vertices - (center_x, center_y)).tolist()
         shape = shapes_lib.vertices_to_polygon(vertices)
         diameter = shapes_lib.compute_shape_diameter(shape)
         body = Body([shape],
@@ -123,21 +138,21 @@ class TaskCreator(object):
                     phantom_vertices=None)
         body._thrift_body.position.x = center_x
         body._thrift_body.position.y = center_y
-
-        self.scene.bodies.append(body._thrift_body)
-        self.body_list.append(body)
-        return body
+        return self._register_body(body)
 
     def add_multipolygons(self,
                           polygons: Sequence[Sequence[Tuple[float, float]]],
                           dynamic: bool = True):
         """Adds a union of convex polygons."""
         # Make sure the center mass is at zero. That makes rendering more precise.
+        polygons = [
+            np.asarray(vertices, dtype=np.float64) for vertices in polygons
+        ]
         (center_x,
          center_y), _ = shapes_lib.compute_union_of_polygons_centroid(polygons)
         shapes = []
         for vertices in polygons:
-            vertices = [(x - center_x, y - center_y) for x, y in vertices]
+            vertices = (vertices - (center_x, center_y)).tolist()
             shapes.append(shapes_lib.vertices_to_polygon(vertices))
         # TODO(akhti): fix diameter calculation.
         diameter = shapes_lib.compute_shape_diameter(shapes[0])
@@ -149,10 +164,7 @@ class TaskCreator(object):
 
         body._thrift_body.position.x = center_x
         body._thrift_body.position.y = center_y
-
-        self.scene.bodies.append(body._thrift_body)
-        self.body_list.append(body)
-        return body
+        return self._register_body(body)
 
     def add_default_box(self, scale, dynamic=True):
         return self._add_body_from_builder(shapes_lib.Box,
@@ -211,15 +223,20 @@ class TaskCreator(object):
         shapes, phantom_vertices = builder.build(**builder_kwargs)
         diameter = builder.diameter(**builder_kwargs)
         body = Body(shapes, dynamic, body_type, diameter, phantom_vertices)
+        return self._register_body(body)
+
+    def _register_body(self, body):
+        """Add the body to the scene and to the list of bodies."""
         # FIXME(akhti): get rid of scene.bodies vs body_list duplication.
         self.scene.bodies.append(body._thrift_body)
         self.body_list.append(body)
+        self._is_wall.append(False)
         return body
 
     def _recolor_objects(self, task_body1, task_body2):
         """Change colors so that task bodies are highlighted."""
-        for body in self.body_list:
-            if 'wall' in body.object_type:
+        for body, is_wall in zip(self.body_list, self._is_wall):
+            if is_wall:
                 body.set_color(_role_to_color_name('STATIC'))
             elif body.dynamic:
                 if body == task_body1:
@@ -254,12 +271,8 @@ class TaskCreator(object):
 
         # Add phantom vertices.
         if phantom_vertices is not None:
-            poly_vertices = []
-            for v in phantom_vertices:
-                poly_vertices.append(scene_if.Vector(v[0], v[1]))
-            shape = scene_if.Shape(polygon=scene_if.Polygon(
-                vertices=poly_vertices))
-            self.task.phantomShape = shape
+            self.task.phantomShape = _phantom_vertices_to_shape(
+                tuple((v[0], v[1]) for v in phantom_vertices))
 
         if description is None:
             self._recolor_objects(body1, body2)
@@ -287,17 +300,16 @@ class TaskCreator(object):
 
     def check_task(self):
         if self.task.tier in ('BALL', 'TWO_BALLS', 'RAMP'):
-            body1 = self.body_list[self.task.bodyId1]
-            body2 = self.body_list[self.task.bodyId2]
-            if 'wall' in body1.object_type or 'wall' in body2.object_type:
+            if (self._is_wall[self.task.bodyId1] or
+                    self._is_wall[self.task.bodyId2]):
                 raise ValueError(
                     'Cannot use wall for tiers BALL, TWO_BALLS, and RAMP.')
             if self.task.relationships[0] != (
                     self.SpatialRelationship.TOUCHING):
                 raise ValueError('Cannot use anything but TOUCHING'
                                  ' for tiers BALL, TWO_BALLS, and RAMP.')
-            for body in self.body_list:
-                if "wall" not in body.object_type and not body._thrift_body.shapeType:
+            for body, is_wall in zip(self.body_list, self._is_wall):
+                if not is_wall and not body._thrift_body.shapeType:
                     raise ValueError('All bodies must have a defined shape'
                                      ' for tiers BALL, TWO_BALLS, and RAMP.'
                                      f' Bad object type: {body.object_type}')
@@ -363,11 +375,9 @@ class Body(object):
         return self.phantom_vertices
 
     def set(self, **attributes):
-        order = ('angle', 'left', 'right', 'top', 'bottom', 'center_x',
-                 'center_y', 'color')
-        for name in order:
+        for name, setter in self._ORDERED_SETTERS:
             if name in attributes:
-                getattr(self, 'set_' + name)(attributes.pop(name))
+                setter(self, attributes.pop(name))
         assert not attributes, 'Unknown attributes'
         return self
 
@@ -383,29 +393,32 @@ class Body(object):
                 self._thrift_body.shapeType = shape_type
         return self
 
-    def _yield_coordinates(self):
+    def _coordinate_lists(self):
+        """Returns lists of absolute x and y coordinates of the body extent."""
         x = self._thrift_body.position.x
         y = self._thrift_body.position.y
-
-        def _to_absolute(rel_x, rel_y, radians):
-            rel_x, rel_y = _rotate(rel_x, rel_y, radians)
-            return rel_x + x, rel_y + y
-
+        angle = self._thrift_body.angle
+        xs, ys = [], []
         for shape in self._thrift_body.shapes:
             if shape.circle:
                 r = shape.circle.radius
-                yield _to_absolute(r, r, radians=0)
-                yield _to_absolute(-r, -r, radians=0)
+                xs.extend((x + r, x - r))
+                ys.extend((y + r, y - r))
             else:
                 assert shape.polygon
                 for v in shape.polygon.vertices:
-                    yield _to_absolute(v.x,
-                                       v.y,
-                                       radians=self._thrift_body.angle)
+                    if angle:
+                        rel_x, rel_y = _rotate(v.x, v.y, angle)
+                    else:
+                        rel_x, rel_y = v.x, v.y
+                    xs.append(rel_x + x)
+                    ys.append(rel_y + y)
+        return xs, ys
 
     def push(self, x, y):
         """Apply the shift vector in the system of the body's coordinates."""
-        x, y = _rotate(x, y, self._thrift_body.angle)
+        if self._thrift_body.angle:
+            x, y = _rotate(x, y, self._thrift_body.angle)
         self._thrift_body.position.x += x
         self._thrift_body.position.y += y
         return self
@@ -453,6 +466,18 @@ class Body(object):
         self._thrift_body.color = color_id
         return self
 
+    # Setters used by `set` in the order they are applied.
+    _ORDERED_SETTERS = (
+        ('angle', set_angle),
+        ('left', set_left),
+        ('right', set_right),
+        ('top', set_top),
+        ('bottom', set_bottom),
+        ('center_x', set_center_x),
+        ('center_y', set_center_y),
+        ('color', set_color),
+    )
+
     @property
     def width(self):
         return self.right - self.left
@@ -471,19 +496,23 @@ class Body(object):
 
     @property
     def right(self):
-        return max(x for x, y in self._yield_coordinates())
+        xs, ys = self._coordinate_lists()
+        return max(xs)
 
     @property
     def left(self):
-        return min(x for x, y in self._yield_coordinates())
+        xs, ys = self._coordinate_lists()
+        return min(xs)
 
     @property
     def top(self):
-        return max(y for x, y in self._yield_coordinates())
+        xs, ys = self._coordinate_lists()
+        return max(ys)
 
     @property
     def bottom(self):
-        return min(y for x, y in self._yield_coordinates())
+        xs, ys = self._coordinate_lists()
+        return min(ys)
 
     @property
     def description(self):
@@ -492,6 +521,18 @@ class Body(object):
         return f'{self.color} {self.object_type}'
 
 
+@functools.lru_cache(maxsize=1024)
+def _phantom_vertices_to_shape(
+        phantom_vertices: Tuple[Tuple[float, float], ...]) -> scene_if.Shape:
+    """Build phantom shape for the vertices.
+
+    Instances of the same template usually share the phantom shape, so the
+    shape is built once and reused. The shape must not be modified.
+    """
+    poly_vertices = [scene_if.Vector(x, y) for x, y in phantom_vertices]
+    return scene_if.Shape(polygon=scene_if.Polygon(vertices=poly_vertices))
+
+
 def _rotate(x, y, radians):
     cos, sin = math.cos(radians), math.sin(radians)
     return x * cos - y * sin, x * sin + y * cos
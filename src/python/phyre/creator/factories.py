@@ -31,21 +31,82 @@ DIVERSITY_FILTER = 0.3
 
 EvalFlags = phyre.eval_task_complexity.Flags
 
-# Defines paramater for task evaluation and selection.
-#
-#   max_search_tasks: for how many task instances to compute eval stats.
-#   required_flags:
-#   excluded_flags: a list of solvability flags that must present or must not
-#      present. Each flag has the following syntax: <TIER>:<CLASS>,
-#      e.g., BALL:GOOD_STABLE, TWO_BALLS:IMPOSSIBLE, BALL:TRIVIAL.
-#      See ALLOWED_FLAGS for the list of all solvability classes.
-SearchParams = collections.namedtuple(
-    'SearchParams',
-    'max_search_tasks,diversify_tier,required_flags,excluded_flags')
-
 SOLVABILITY_CLASSES = ('IMPOSSIBLE', 'GOOD_STABLE', 'TRIVIAL')
 
-SearchParams.__new__.__defaults__ = (DEFAULT_MAX_SEARCH_TASKS, None, [], [])
+
+class SearchParams(object):
+    """Defines paramater for task evaluation and selection.
+
+    The object is not supposed to be modified after creation.
+
+    Attributes:
+      max_search_tasks: for how many task instances to compute eval stats.
+      diversify_tier: None or the tier to select the most diverse subset of
+        tasks for.
+      required_flags:
+      excluded_flags: a tuple of solvability flags that must present or must
+        not present. Each flag has the following syntax: <TIER>:<CLASS>,
+        e.g., BALL:GOOD_STABLE, TWO_BALLS:IMPOSSIBLE, BALL:TRIVIAL.
+        See SOLVABILITY_CLASSES for the list of all solvability classes.
+      required_bitmasks:
+      excluded_bitmasks: parsed required_flags and excluded_flags, a dict
+        mapping tiers to a bitmask of EvalFlags.
+    """
+
+    __slots__ = ('max_search_tasks', 'diversify_tier', 'required_flags',
+                 'excluded_flags', 'required_bitmasks', 'excluded_bitmasks')
+
+    def __init__(self,
+                 max_search_tasks=DEFAULT_MAX_SEARCH_TASKS,
+                 diversify_tier=None,
+                 required_flags=(),
+                 excluded_flags=()):
+        _validate_flags(required_flags)
+        _validate_flags(excluded_flags)
+        self.max_search_tasks = max_search_tasks
+        self.diversify_tier = diversify_tier
+        self.required_flags = tuple(required_flags)
+        self.excluded_flags = tuple(excluded_flags)
+        self.required_bitmasks = _flags_to_tier_bitmasks(required_flags)
+        self.excluded_bitmasks = _flags_to_tier_bitmasks(excluded_flags)
+
+    @classmethod
+    def from_dict(cls, params):
+        """Creates SearchParams from a dict of keyword arguments.
+
+        Besides the constructor arguments, the dict may have boolean
+        shortcuts reject_ball_solvable, require_ball_solvable, and
+        require_two_ball_solvable that add the corresponding flags.
+        """
+        params = dict(params)
+        required_flags = list(params.pop('required_flags', ()))
+        excluded_flags = list(params.pop('excluded_flags', ()))
+        if params.pop('reject_ball_solvable', False):
+            excluded_flags.append('BALL:GOOD_STABLE')
+        if params.pop('require_ball_solvable', False):
+            required_flags.append('BALL:GOOD_STABLE')
+        if params.pop('require_two_ball_solvable', False):
+            required_flags.append('TWO_BALLS:GOOD_STABLE')
+        return cls(required_flags=required_flags,
+                   excluded_flags=excluded_flags,
+                   **params)
+
+    def __repr__(self):
+        return ('SearchParams(max_search_tasks=%r, diversify_tier=%r,'
+                ' required_flags=%r, excluded_flags=%r)' %
+                (self.max_search_tasks, self.diversify_tier,
+                 self.required_flags, self.excluded_flags))
+
+
+def _sum_rows(matrix, matrix_float, rows):
+    """Returns matrix[rows].sum(axis=0) for a boolean matrix and row mask.
+
+    matrix_float is a float32 copy of matrix used for GEMV if most of the rows
+    are selected. It is faster than gathering them and exact for 0/1 values.
+    """
+    if np.count_nonzero(rows) * 4 < len(rows):
+        return matrix[rows].sum(axis=0)
+    return (rows.astype(np.float32) @ matrix_float).astype(np.int64)
 
 
 def select_max_diverse_subset(tasks, eval_stats, max_tasks, tier):
@@ -55,38 +116,64 @@ def select_max_diverse_subset(tasks, eval_stats, max_tasks, tier):
     template_tasks = set(task.taskId for task in tasks)
     actions_on_tasks = eval_stats['solution_power'][tier]['actions_on_tasks']
     eval_task_ids = eval_stats['solution_power'][tier]['task_ids']
-    indicies = np.array([
-        i for i in range(len(eval_task_ids))
-        if eval_task_ids[i] in template_tasks
-    ])
-    task_ids = [
-        task_id for task_id in eval_task_ids if task_id in template_tasks
-    ]
-    action_tasks = actions_on_tasks.take(indicies, axis=1)
+    indicies = np.flatnonzero(
+        [task_id in template_tasks for task_id in eval_task_ids])
+    task_ids = np.asarray(eval_task_ids)[indicies]
+    # Actions-on-tasks matrix is binary, so keep it as bool to reduce the
+    # amount of memory scanned on each iteration.
+    action_tasks = actions_on_tasks.take(indicies, axis=1).astype(bool)
     threshold = DIVERSITY_FILTER * max_tasks
     assert len(task_ids) == action_tasks.shape[1], (
         f'Number of task ids {len(task_ids)} does not match number of columns '
         f'in task eval stats actions_on_tasks matrix {action_tasks.shape[1]}')
-    while action_tasks.shape[1] > max_tasks:
-        action_solves = action_tasks.sum(axis=1)
+    # Instead of deleting columns for removed tasks, mark them as not alive
+    # and keep number of solved alive tasks for each action.
+    alive = np.ones(action_tasks.shape[1], dtype=bool)
+    num_alive = len(alive)
+    action_tasks_float = action_tasks.astype(np.float32)
+    action_solves = action_tasks.sum(axis=1)
+    # Problem actions and number of problem actions solving each task. Both are
+    # updated only for actions that start or stop being problem actions.
+    problem_actions = np.zeros(len(action_solves), dtype=bool)
+    problem_tasks_solve = np.zeros(len(alive), dtype=np.int64)
+    while num_alive > max_tasks:
         # Find problem actions that solve > threshold % of task instances.
-        problem_tasks = action_tasks[action_solves > threshold]
-        problem_tasks_solve = problem_tasks.sum(axis=0)
-        # Remove the task solved by largest number of problem actions.
-        max_problem_task = problem_tasks_solve.argmax()
-        num_solved = problem_tasks_solve.max()
-        if not num_solved:
+        is_problem = action_solves > threshold
+        added = is_problem & ~problem_actions
+        removed = problem_actions & ~is_problem
+        if added.any():
+            problem_tasks_solve += _sum_rows(action_tasks, action_tasks_float,
+                                             added)
+        if removed.any():
+            problem_tasks_solve -= _sum_rows(action_tasks, action_tasks_float,
+                                             removed)
+        problem_actions = is_problem
+        # Remove the task solved by largest number of problem actions. While
+        # the set of problem actions stays the same, the counts for the other
+        # tasks do not change. So the next worst tasks could be removed in the
+        # same pass in the order of the counts.
+        problem_tasks_solve_alive = np.where(alive, problem_tasks_solve, -1)
+        num_to_remove = num_alive - max_tasks
+        kth = len(alive) - num_to_remove
+        min_solved = np.partition(problem_tasks_solve_alive, kth)[kth]
+        max_problem_tasks = np.flatnonzero(
+            problem_tasks_solve_alive >= min_solved)
+        max_problem_tasks = max_problem_tasks[np.argsort(
+            -problem_tasks_solve_alive[max_problem_tasks], kind='stable')]
+        if problem_tasks_solve_alive[max_problem_tasks[0]] <= 0:
             # Current diveristy requirement has been fufilled, so
             # continue filtering with a stricter diversity requirement.
             threshold = 0.75 * threshold
             continue
-        action_tasks = np.delete(action_tasks, max_problem_task, axis=1)
-        task_ids.pop(max_problem_task)
-        assert len(task_ids) == action_tasks.shape[1], (
-            f'Number of task ids {len(task_ids)} does not match number of '
-            'columns in task  eval stats actions_on_tasks matrix '
-            f'{action_tasks.shape[1]}')
-    task_ids = set(task_ids)
+        for max_problem_task in max_problem_tasks[:num_to_remove]:
+            if problem_tasks_solve_alive[max_problem_task] <= 0:
+                break
+            alive[max_problem_task] = False
+            num_alive -= 1
+            action_solves -= action_tasks[:, max_problem_task]
+            if (problem_actions & (action_solves <= threshold)).any():
+                break
+    task_ids = set(task_ids[alive].tolist())
     assert len(task_ids) == max_tasks or len(task_ids) == len(tasks), (
         f'After diversity filtering number of task ids {len(task_ids)} does '
         f'not match maximum number of tasks {max_tasks}, or starting number'
@@ -94,6 +181,21 @@ def select_max_diverse_subset(tasks, eval_stats, max_tasks, tier):
     return [task for task in tasks if task.taskId in task_ids]
 
 
+def _yield_shuffled_indices(num_indices, num_expected):
+    """Yields stable_shuffle(range(num_indices)) lazily.
+
+    The first num_expected indices are selected without shuffling the whole
+    range if the range is much bigger. The rest is shuffled only if requested.
+    """
+    if num_indices > 2 * num_expected:
+        head = phyre.util.stable_partial_shuffle(range(num_indices),
+                                                 num_expected)
+        yield from head
+    else:
+        head = []
+    yield from phyre.util.stable_shuffle(range(num_indices))[len(head):]
+
+
 def define_task(f):
     """Use @creator.define_task to decorate a task definition."""
 
@@ -132,23 +234,10 @@ def define_task_template(max_tasks=None,
     if search_params is None:
         search_params = SearchParams()
     elif isinstance(search_params, dict):
-        search_params['required_flags'] = list(
-            search_params.get('required_flags', []))
-        search_params['excluded_flags'] = list(
-            search_params.get('excluded_flags', []))
-        if search_params.pop('reject_ball_solvable', False):
-            search_params['excluded_flags'].append('BALL:GOOD_STABLE')
-        if search_params.pop('require_ball_solvable', False):
-            search_params['required_flags'].append('BALL:GOOD_STABLE')
-        if search_params.pop('require_two_ball_solvable', False):
-            search_params['required_flags'].append('TWO_BALLS:GOOD_STABLE')
-        search_params = SearchParams(**search_params)
+        search_params = SearchParams.from_dict(search_params)
     else:
         assert isinstance(search_params, SearchParams)
 
-    _validate_flags(search_params.required_flags)
-    _validate_flags(search_params.excluded_flags)
-
     assert isinstance(version, str), version
 
     def decorator(f):
@@ -168,6 +257,23 @@ def _validate_flags(flags):
         assert solvability.upper() in SOLVABILITY_CLASSES, flag
 
 
+def _flags_to_bitmask(flags):
+    bitmask = 0
+    for flag in flags:
+        bitmask |= 1 << flag.value
+    return bitmask
+
+
+def _flags_to_tier_bitmasks(flags):
+    """Converts a list of <TIER>:<CLASS> flags to a dict tier -> bitmask."""
+    bitmasks = collections.defaultdict(int)
+    for flag in flags:
+        tier, solvability = flag.split(':')
+        solvability = getattr(EvalFlags, solvability.upper())
+        bitmasks[tier.lower()] |= _flags_to_bitmask([solvability])
+    return dict(bitmasks)
+
+
 class TempateTaskScript(object):
 
     def __init__(self, builder, dict_of_template_values, max_tasks,
@@ -189,19 +295,27 @@ class TempateTaskScript(object):
     def yield_tasks(self, template_id):
         if self.params:
             keys, lists_of_values = zip(*sorted(self.params.items()))
-            value_sets = list(itertools.product(*lists_of_values))
-            indices = phyre.util.stable_shuffle(list(range(len(value_sets))))
+            # Parameter sets are decoded from their index in the cartesian
+            # product on the fly instead of materializing the product.
+            shape = tuple(map(len, lists_of_values))
+            num_value_sets = int(np.prod(shape))
+            indices = _yield_shuffled_indices(
+                num_value_sets, self.search_params.max_search_tasks)
         else:
-            keys = tuple()
-            value_sets = [tuple()]
+            keys = lists_of_values = shape = tuple()
             indices = [0]
         task_index = 0
+        C = phyre.creator.creator.TaskCreator()
         for params_id in indices:
-            keyed_values = dict(zip(keys, value_sets[params_id]))
-            C = phyre.creator.creator.TaskCreator()
+            value_ids = np.unravel_index(params_id, shape)
+            keyed_values = {
+                key: values[value_id] for key, values, value_id in zip(
+                    keys, lists_of_values, value_ids)
+            }
             try:
                 self.builder(C, **keyed_values)
             except SkipTemplateParams:
+                C.reset()
                 continue
             C.check_task()
             C.task.taskId = '%s:%03d' % (template_id, task_index)
@@ -209,6 +323,7 @@ class TempateTaskScript(object):
             # Not serialized. For within session use only.
             C.task.template_params = keyed_values
             yield C.task
+            C.reset()
 
     def get_specific_task(self, task_id):
         template_id, index = task_id.split(':')
@@ -217,21 +332,22 @@ class TempateTaskScript(object):
         return list(tasks)[index]
 
     def _check_flags(self, flag_eval_stats, task_id):
-
-        def has_flag(flag):
-            tier, solvability = flag.split(':')
-            solvability = getattr(EvalFlags, solvability.upper())
-            return solvability in flag_eval_stats[tier.lower()][task_id]
-
-        if not all(map(has_flag, self.search_params.required_flags)):
-            return False
-        if any(map(has_flag, self.search_params.excluded_flags)):
-            return False
+        """Checks the task against precomputed flag bitmasks of each tier."""
+        params = self.search_params
+        for tier, required in params.required_bitmasks.items():
+            bitmask = _flags_to_bitmask(flag_eval_stats[tier][task_id])
+            if bitmask & required != required:
+                return False
+        for tier, excluded in params.excluded_bitmasks.items():
+            if _flags_to_bitmask(flag_eval_stats[tier][task_id]) & excluded:
+                return False
         return True
 
     def _build_tasks_with_eval_stats(self, template_id, eval_stats):
         tasks = []
-        for task in self.build_tasks_for_search(template_id):
+        # Tasks are built and checked lazily so that both stop as soon as
+        # enough tasks are found.
+        for task in self._yield_tasks_for_search(template_id):
             if not self._check_flags(eval_stats['flags'], task.taskId):
                 continue
 
@@ -247,10 +363,13 @@ class TempateTaskScript(object):
     def build_tasks(self, template_id, max_tasks):
         return list(itertools.islice(self.yield_tasks(template_id), max_tasks))
 
-    def build_tasks_for_search(self, template_id):
-        return self.build_tasks(template_id,
+    def _yield_tasks_for_search(self, template_id):
+        return itertools.islice(self.yield_tasks(template_id),
                                 self.search_params.max_search_tasks)
 
+    def build_tasks_for_search(self, template_id):
+        return list(self._yield_tasks_for_search(template_id))
+
     def __call__(self, template_id, eval_stats=None):
         if eval_stats is not None:
             tasks = self._build_tasks_with_eval_stats(template_id, eval_stats)
@@ -21,8 +21,11 @@ be used by clients instead of direct introspection.
 """
 from typing import Sequence, Tuple
 import abc
+import functools
 import itertools
 import math
+import os
+import types
 
 import numpy as np
 
@@ -32,26 +35,67 @@ from phyre.interface.scene import ttypes as scene_if
 SCENE_HEIGHT = constants.SCENE_HEIGHT
 SCENE_WIDTH = constants.SCENE_WIDTH
 
+# Convexity checks of built polygons are asserts and so are removed by
+# `python -O`. Setting PHYRE_SKIP_POLYGON_VALIDATION disables them as well.
+_VALIDATE_POLYGONS = not os.environ.get('PHYRE_SKIP_POLYGON_VALIDATION')
 
+# Corner signs of a centered box in counter clockwise order starting from
+# top-right.
+_BOX_CORNER_SIGNS = ((1, 1), (-1, 1), (-1, -1), (1, -1))
+
+
+@functools.lru_cache(maxsize=1)
 def get_builders():
+    """Returns a read-only mapping from builder names to builders.
+
+    The mapping is cached and is recomputed only if a new builder is defined.
+    """
 
     def yield_subclasses(cls):
         for subcls in cls.__subclasses__():
             yield subcls
             yield from yield_subclasses(subcls)
 
-    return {cls.__name__.lower(): cls for cls in yield_subclasses(ShapeBuilder)}
+    return types.MappingProxyType(
+        {cls.__name__.lower(): cls for cls in yield_subclasses(ShapeBuilder)})
 
 
 class ShapeBuilder(object):
     SHAPE_TYPE = scene_if.ShapeType.UNDEFINED
 
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        get_builders.cache_clear()
+        # Decompose scale range once instead of on every size conversion.
+        if hasattr(cls, 'SCALE_RANGE'):
+            assert len(cls.SCALE_RANGE) == 2
+            cls._scale_bounds = tuple(cls.SCALE_RANGE)
+            cls._scale_min = min(cls.SCALE_RANGE)
+            cls._scale_span = max(cls.SCALE_RANGE) - cls._scale_min
+
+    @classmethod
+    def _interpolate(cls, scale):
+        """Maps scale in [0, 1] to a size in SCALE_RANGE."""
+        low, high = cls._scale_bounds
+        return (1. - scale) * low + scale * high
+
+    @classmethod
+    def _inverse_interpolate(cls, size):
+        """Maps a size in SCALE_RANGE to scale in [0, 1]."""
+        return (size - cls._scale_min) / cls._scale_span
+
     @classmethod
     def default_sizes(cls, scale):
         """Convert single scale parameter to a dict of arguments for build."""
         raise RuntimeError('Using "scale" is not supported for %s' %
                            cls.__name__)
 
+    @classmethod
+    @functools.lru_cache(maxsize=1024)
+    def _cached_default_sizes(cls, scale):
+        """Cached version of default_sizes. The result must not be modified."""
+        return cls.default_sizes(scale)
+
     @classmethod
     def diameter_to_default_scale(cls, diameter):
         """Convert diameter parameter to a default size scale."""
@@ -83,7 +127,7 @@ class ShapeBuilder(object):
         if diameter is not None:
             scale = cls.diameter_to_default_scale(diameter)
         if scale is not None:
-            kwargs.update(cls.default_sizes(scale))
+            kwargs.update(cls._cached_default_sizes(scale))
         ret = cls._build(**kwargs)
         # Add phantom_vertices if not provided.
         if not isinstance(ret, (tuple, list)):
@@ -99,96 +143,124 @@ class ShapeBuilder(object):
     @classmethod
     def diameter(cls, scale=None, **kwargs):
         if scale is not None:
-            kwargs.update(cls.default_sizes(scale))
+            kwargs.update(cls._cached_default_sizes(scale))
         return cls._diameter(**kwargs)
 
     @classmethod
     def _diameter(cls, **kwargs):
+        """Compute diameter from build arguments. Must be defined by builders."""
         raise NotImplementedError()
 
-    @classmethod
-    def diameter(cls, scale=None, **kwargs):
-        if scale is not None:
-            kwargs.update(cls.default_sizes(scale))
-        return cls._diameter(**kwargs)
-
-    @classmethod
-    def _diameter(cls, **kwargs):
-        raise NotImplementedError()
-
-
-def _interpolate(scale_range, scale):
-    assert len(scale_range) == 2
-    return (1. - scale) * scale_range[0] + scale * scale_range[1]
-
-
-def _inverse_interpolate(scale_range, interpolated_value):
-    assert len(scale_range) == 2
-    min_scale = min(scale_range)
-    scale_range = [each - min_scale for each in scale_range]
-    interpolated_value -= min_scale
-    return interpolated_value / max(scale_range)
-
 
-def vertices_to_polygon(vertices):
-    poly_vertices = []
-    for v in vertices:
-        poly_vertices.append(scene_if.Vector(v[0], v[1]))
+def vertices_to_polygon(vertices, validate=True):
+    # Thrift objects are mutable, so only the validation result is cached.
+    vertices = tuple((v[0], v[1]) for v in vertices)
+    poly_vertices = [scene_if.Vector(x, y) for x, y in vertices]
     shape = scene_if.Shape(polygon=scene_if.Polygon(vertices=poly_vertices))
-    assert is_valid_convex_polygon(poly_vertices)
+    if validate and _VALIDATE_POLYGONS:
+        assert _is_valid_convex_vertices(vertices), vertices
     return shape
 
 
 def compute_shape_diameter(shape: scene_if.Shape) -> float:
-
-    def distance(pair):
-        p1, p2 = pair
-        return ((p1.x - p2.x)**2 + (p1.y - p2.y)**2)**0.5
-
     if shape.polygon:
-        return max(
-            map(distance, itertools.combinations(shape.polygon.vertices, 2)))
+        return _polygon_diameter(
+            tuple((v.x, v.y) for v in shape.polygon.vertices))
     else:
         return shape.circle.radius
 
 
-def _merge_centroids(points, masses):
-    mass = sum(masses)
-    x = sum(p[0] * m / mass for p, m in zip(points, masses))
-    y = sum(p[1] * m / mass for p, m in zip(points, masses))
-    return (x, y), mass
+# Rotating calipers run in Python, so they only beat the quadratic NumPy
+# version for large polygons.
+_MIN_VERTICES_FOR_CALIPERS = 64
 
 
-def compute_polygon_centroid(vertices: Sequence[Tuple[float, float]]
-                            ) -> Tuple[Tuple[float, float], float]:
-    """Compute center of mass and mass of a convex polygon."""
+@functools.lru_cache(maxsize=1024)
+def _polygon_diameter(vertices):
+    # Validation may be skipped when building shapes, so check that calipers
+    # are applicable, i.e., vertices are convex and in CCW order.
+    if (len(vertices) >= _MIN_VERTICES_FOR_CALIPERS and
+            _is_valid_convex_vertices(vertices)):
+        return _convex_polygon_diameter(vertices)
+    points = np.array(vertices)
+    deltas = points[:, None] - points[None]
+    return float(np.sqrt((deltas**2).sum(axis=2).max()))
+
+
+def _convex_polygon_diameter(vertices):
+    """Computes diameter of a convex CCW polygon with rotating calipers."""
 
-    def _triangle_centroid(points):
-        x = sum(p[0] for p in points) / 3
-        y = sum(p[1] for p in points) / 3
-        l = lambda p1, p2: math.sqrt((p1[0] - p2[0])**2 + (p1[1] - p2[1])**2)
-        a, b, c = map(l, points, points[1:] + points)
-        p = (a + b + c) / 2
-        mass = math.sqrt(p * (p - a) * (p - b) * (p - c))
-        return (x, y), mass
+    def double_area(a, b, c):
+        return (b[0] - a[0]) * (c[1] - a[1]) - (b[1] - a[1]) * (c[0] - a[0])
 
-    centroid = [0., 0.]
-    mass = 0.
-    for i in range(2, len(vertices)):
-        triangle_centroid, triangle_mass = _triangle_centroid(
-            [vertices[0], vertices[i - 1], vertices[i]])
-        centroid, mass = _merge_centroids([centroid, triangle_centroid],
-                                          [mass, triangle_mass])
+    def squared_distance(a, b):
+        return (a[0] - b[0])**2 + (a[1] - b[1])**2
 
-    return centroid, mass
+    num_vertices = len(vertices)
+    max_squared_distance = 0.
+    # For each edge (p, q) move j to the vertex farthest from the edge. The
+    # diameter is attained at one of such antipodal pairs.
+    j = 1
+    for i in range(num_vertices):
+        p, q = vertices[i], vertices[(i + 1) % num_vertices]
+        while (double_area(p, q, vertices[(j + 1) % num_vertices])
+               > double_area(p, q, vertices[j])):
+            j = (j + 1) % num_vertices
+        max_squared_distance = max(max_squared_distance,
+                                   squared_distance(p, vertices[j]),
+                                   squared_distance(q, vertices[j]))
+    return math.sqrt(max_squared_distance)
+
+
+def compute_polygon_centroid(vertices: Sequence[Tuple[float, float]]
+                            ) -> Tuple[Tuple[float, float], float]:
+    """Compute center of mass and mass of a convex polygon.
+
+    Vertices could be given either as a sequence of pairs or as an array of
+    shape [num_vertices, 2].
+    """
+    if not isinstance(vertices, np.ndarray):
+        vertices = np.array(vertices, dtype=np.float64)
+    # Slicing is much cheaper than np.roll for small polygons.
+    xs, ys = vertices.T
+    next_xs = np.concatenate([xs[1:], xs[:1]])
+    next_ys = np.concatenate([ys[1:], ys[:1]])
+    # Shoelace formula.
+    cross = xs * next_ys - ys * next_xs
+    area = cross.sum() / 2
+    x = ((xs + next_xs) * cross).sum() / (6 * area)
+    y = ((ys + next_ys) * cross).sum() / (6 * area)
+    return (float(x), float(y)), float(abs(area))
 
 
 def compute_union_of_polygons_centroid(
         polygons: Sequence[Sequence[Tuple[float, float]]]
 ) -> Tuple[Tuple[float, float], float]:
-    """Compute center of mass and mass of a convex polygon."""
+    """Compute center of mass and mass of a union of convex polygons."""
     points, masses = zip(*map(compute_polygon_centroid, polygons))
-    return _merge_centroids(points, masses)
+    x, y = np.average(points, axis=0, weights=masses)
+    return (float(x), float(y)), float(sum(masses))
+
+
+def _is_valid_convex_looped_coords(coords):
+    """Checks convexity given [n + 2, 2] coords ending with the first two.
+
+    Looping the first two points gets the wrap-around triplets by slicing.
+    """
+    a = coords[2:] - coords[1:-1]
+    b = coords[:-2] - coords[1:-1]
+    # Exterior product between vector to p3 and vector to p1 must be
+    # positive.
+    return bool((a[:, 0] * b[:, 1] - a[:, 1] * b[:, 0] > 0).all())
+
+
+@functools.lru_cache(maxsize=4096)
+def _is_valid_convex_vertices(vertices):
+    """Cached is_valid_convex_polygon for a tuple of (x, y) tuples."""
+    if len(vertices) < 3:
+        return False
+    return _is_valid_convex_looped_coords(
+        np.array(vertices + vertices[:2], dtype=np.float64))
 
 
 def is_valid_convex_polygon(points):
@@ -196,16 +268,11 @@ def is_valid_convex_polygon(points):
     # conter clockwise order.
     if len(points) < 3:
         return False
-    looped_points = points + points[:2]
-    looped_points = [np.array([p.x, p.y]) for p in looped_points]
-    for p1, p2, p3 in zip(looped_points, looped_points[1:], looped_points[2:]):
-        a = p3 - p2
-        b = p1 - p2
-        # Exterior product between vector to p3 and vector to p1 must be
-        # positive.
-        if a[0] * b[1] - a[1] * b[0] <= 0:
-            return False
-    return True
+    looped_points = itertools.chain(points, points[:2])
+    coords = np.fromiter((c for p in looped_points for c in (p.x, p.y)),
+                         dtype=np.float64,
+                         count=2 * (len(points) + 2))
+    return _is_valid_convex_looped_coords(coords.reshape(-1, 2))
 
 
 class Ball(ShapeBuilder):
@@ -216,12 +283,12 @@ class Ball(ShapeBuilder):
     @classmethod
     def diameter_to_default_scale(cls, diameter):
         radius = diameter / 2.0 - cls.RASTERIZATION_BUFFER
-        return _inverse_interpolate(cls.SCALE_RANGE, radius)
+        return cls._inverse_interpolate(radius)
 
     @classmethod
     def default_sizes(cls, scale):
         # Map scale and corresponding alpha to radius.
-        radius = _interpolate(cls.SCALE_RANGE, scale)
+        radius = cls._interpolate(scale)
         return dict(radius=radius)
 
     @classmethod
@@ -241,17 +308,16 @@ class Box(ShapeBuilder):
 
     @classmethod
     def default_sizes(cls, scale):
-        size = _interpolate(cls.SCALE_RANGE, scale)
+        size = cls._interpolate(scale)
         return dict(height=size, width=size)
 
     @classmethod
     def _build(cls, width, height):
-        vertices = []
-        for i in range(4):
-            vx = (1 - 2 * (i in (1, 2))) / 2. * width
-            vy = (1 - 2 * (i in (2, 3))) / 2. * height
-            vertices.append((vx, vy))
-        return vertices_to_polygon(vertices)
+        # A box is a valid polygon iff both sizes are positive.
+        assert width > 0 and height > 0, (width, height)
+        hw, hh = width / 2., height / 2.
+        vertices = [(sx * hw, sy * hh) for sx, sy in _BOX_CORNER_SIGNS]
+        return vertices_to_polygon(vertices, validate=False)
 
     @classmethod
     def _diameter(cls, width, height):
@@ -260,7 +326,7 @@ class Box(ShapeBuilder):
     @classmethod
     def diameter_to_default_scale(cls, diameter):
         size = math.sqrt((diameter**2) / 2.0)
-        return _inverse_interpolate(cls.SCALE_RANGE, size)
+        return cls._inverse_interpolate(size)
 
 
 class Bar(Box):
@@ -270,14 +336,14 @@ class Bar(Box):
     @classmethod
     def default_sizes(cls, scale):
         return dict(
-            width=_interpolate(cls.SCALE_RANGE, scale),
+            width=cls._interpolate(scale),
             height=cls.BAR_HEIGHT,
         )
 
     @classmethod
     def diameter_to_default_scale(cls, diameter):
         size = math.sqrt((diameter**2) - (cls.BAR_HEIGHT**2))
-        return _inverse_interpolate(cls.SCALE_RANGE, size)
+        return cls._inverse_interpolate(size)
 
 
 class StandingSticks(ShapeBuilder):
@@ -290,7 +356,7 @@ class StandingSticks(ShapeBuilder):
     def default_sizes(cls, scale):
         return dict(
             angle=cls.ANGLE,
-            width=_interpolate(cls.SCALE_RANGE, scale),
+            width=cls._interpolate(scale),
             height=cls.BAR_HEIGHT,
         )
 
@@ -298,23 +364,17 @@ class StandingSticks(ShapeBuilder):
     def _build(cls, angle, width, height):
 
         # create base bar (top-right, top-left, bottom-left, bottom-right):
-        bar = []
         y_offset = 0.0  # this governs how asymmetric the sticks are
-        for i in range(4):
-            vx = ((1 - 2 * (i in (1, 2))) / 3.) * width
-            vy = ((1 - 2 * (i in (2, 3))) / 3. + y_offset) * height
-            bar.append((vx, vy))
+        bar = np.array(_BOX_CORNER_SIGNS) * (1 / 3.)
+        bar = (bar + (0, y_offset)) * (width, height)
 
         # rotate bar to create both sticks:
+        radian = angle / 180. * math.pi
+        cos, sin = math.cos(radian), math.sin(radian)
         shapes = []
-        radians = [_angle / 180. * math.pi for _angle in [-angle, angle]]
-        for radian in radians:
-            rotated_bar = []
-            for x, y in bar:
-                vx = math.cos(radian) * x - math.sin(radian) * y
-                vy = math.cos(radian) * y + math.sin(radian) * x
-                rotated_bar.append((vx, vy))
-            shapes.append(rotated_bar)
+        for s in (-sin, sin):
+            rotation = np.array([[cos, -s], [s, cos]])
+            shapes.append((bar @ rotation.T).tolist())
 
         # construct phantom vertices:
         phantom_vertices = (shapes[1][1], shapes[1][2], shapes[0][3],
@@ -332,7 +392,7 @@ class StandingSticks(ShapeBuilder):
     @classmethod
     def diameter_to_default_scale(cls, diameter):
         width = math.sqrt((diameter**2) - (cls.BAR_HEIGHT**2))
-        return _inverse_interpolate(cls.SCALE_RANGE, width)
+        return cls._inverse_interpolate(width)
 
 
 class Jar(ShapeBuilder):
@@ -340,15 +400,15 @@ class Jar(ShapeBuilder):
     BASE_RATIO = 0.8
     WIDTH_RATIO = 1. / 1.2
     SCALE_RANGE = [0., SCENE_WIDTH]
+    _THICKNESS_LOG_BASE = math.log(0.3 * SCENE_WIDTH)
 
     @classmethod
     def thickness_from_height(cls, height):
-        return (math.log(height) / math.log(0.3 * SCENE_WIDTH) * SCENE_WIDTH /
-                50)
+        return math.log(height) / cls._THICKNESS_LOG_BASE * SCENE_WIDTH / 50
 
     @classmethod
     def default_sizes(cls, scale):
-        height = _interpolate(cls.SCALE_RANGE, scale)
+        height = cls._interpolate(scale)
         width = height * cls.WIDTH_RATIO
         # Thickness is logarithmical and thickness at scale 0.3 is
         # SCENE_WIDTH / 50.
@@ -363,11 +423,8 @@ class Jar(ShapeBuilder):
     @classmethod
     def _build(cls, height, width, thickness, base_width):
         # Create box.
-        vertices = []
-        for i in range(4):
-            vx = (1 - 2 * (i in (1, 2))) / 2. * base_width
-            vy = (1 - 2 * (i in (2, 3))) / 2. * thickness
-            vertices.append((vx, vy))
+        hw, hh = base_width / 2., thickness / 2.
+        vertices = [(sx * hw, sy * hh) for sx, sy in _BOX_CORNER_SIGNS]
 
         # Compute offsets for jar edge coordinates.
         base = (width - base_width) / 2.
@@ -378,21 +435,19 @@ class Jar(ShapeBuilder):
         y_delta = thickness * cos
 
         # Left tilted edge of jar.
-        vertices_left = [
-            [-width / 2, height - (thickness / 2)],
-            [(-base_width / 2), -(thickness / 2)],
-            [(-base_width / 2) + x_delta, y_delta - (thickness / 2)],
-            [(-width / 2) + x_delta_top, height - (thickness / 2)],
-        ]
-
-        # Right tilted edge.
-        vertices_right = [
-            [width / 2, height - (thickness / 2)],
-            [(width / 2) - x_delta_top, height - (thickness / 2)],
-            [(base_width / 2) - x_delta, y_delta - (thickness / 2)],
-            [(base_width / 2), -(thickness / 2)],
-        ]
-
+        top_hw = width / 2.
+        vertices_left = np.array([
+            [-top_hw, height],
+            [-hw, 0],
+            [-hw + x_delta, y_delta],
+            [-top_hw + x_delta_top, height],
+        ]) - (0, hh)
+
+        # Right tilted edge is the mirrored left one.
+        vertices_right = vertices_left[[0, 3, 2, 1]] * (-1, 1)
+
+        vertices_left = vertices_left.tolist()
+        vertices_right = vertices_right.tolist()
         phantom_vertices = (vertices_left[0], vertices_left[1],
                             vertices_right[3], vertices_right[0])
         shapes = [
@@ -413,39 +468,12 @@ class Jar(ShapeBuilder):
         base_to_width_ratio = (1.0 - cls.BASE_RATIO) / 2.0 + cls.BASE_RATIO
         width_to_height_ratio = base_to_width_ratio * cls.WIDTH_RATIO
         height = math.sqrt((diameter**2) / (1 + (width_to_height_ratio**2)))
-        return _inverse_interpolate(cls.SCALE_RANGE, height)
+        return cls._inverse_interpolate(height)
 
     @classmethod
     def center_of_mass(cls, *args, **kwargs):
-
-        def undo_polygon(shape):
-            return [(v.x, v.y) for v in shape.polygon.vertices]
-
         shapes, _ = cls.build(*args, **kwargs)
-        verticies = list(map(undo_polygon, shapes))
-
-        def _merge(points, masses):
-            mass = sum(masses)
-            x = sum(p[0] * m / mass for p, m in zip(points, masses))
-            y = sum(p[1] * m / mass for p, m in zip(points, masses))
-            return (x, y), mass
-
-        def _triangle_centroid(points):
-            x = sum(p[0] for p in points) / 3
-            y = sum(p[1] for p in points) / 3
-            l = lambda p1, p2: math.sqrt((p1[0] - p2[0])**2 +
-                                         (p1[1] - p2[1])**2)
-            a, b, c = map(l, points, points[1:] + points)
-            p = (a + b + c) / 2
-            mass = math.sqrt(p * (p - a) * (p - b) * (p - c))
-            return (x, y), mass
-
-        def _4angle_centroid(points):
-            p1, m1 = _triangle_centroid([points[0], points[1], points[2]])
-            p2, m2 = _triangle_centroid([points[0], points[3], points[2]])
-            return _merge([p1, p2], [m1, m2])
-
-        points, masses = zip(*map(_4angle_centroid, verticies))
-        (x, y), _ = _merge(points, masses)
+        (x, y), _ = compute_union_of_polygons_centroid(
+            [[(v.x, v.y) for v in shape.polygon.vertices] for shape in shapes])
         assert abs(x) <= 1e-5, x
         return x, y
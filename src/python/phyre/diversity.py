@@ -12,6 +12,7 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import collections
 import concurrent.futures
 import os
 
@@ -28,20 +29,42 @@ THRESHOLDS = [0.01, 0.1, 0.25, 0.3, 0.5, 0.75, 0.9]
 GOOD_TIERS = ['ball', 'two_balls']
 NUM_ACTIONS = 1000000
 
+_NUM_LOAD_WORKERS = os.cpu_count() or 1
 
-def compute_cache_power_of_solutions(template, template_tasks, tier):
+
+def compute_cache_power_of_solutions(template,
+                                     template_tasks,
+                                     tier,
+                                     executor=None):
     base_dir = phyre.simulation_cache.get_partial_cache_folder(NUM_ACTIONS)
     assert base_dir.exists(), (f'Partial simulation cache folder {base_dir} '
                                'does not exist')
-    cached_task_actions = {}
-    for task in template_tasks:
-        fname = f'{base_dir}/{tier}/{template}/{task}.gz'
+    fnames = [
+        f'{base_dir}/{tier}/{template}/{task}.gz' for task in template_tasks
+    ]
+    for fname in fnames:
         assert os.path.exists(fname), (f'Partial simulation cache file {fname} '
                                        'does not exist')
-        actions = joblib.load(fname)
-        cached_task_actions[task] = actions
-    action_task = np.stack(list(cached_task_actions.values()), axis=1)
-    num_solved = (action_task > 0).sum(axis=1)
+    if executor is not None:
+        return _count_solving_tasks(fnames, executor)
+    with concurrent.futures.ThreadPoolExecutor(_NUM_LOAD_WORKERS) as executor:
+        return _count_solving_tasks(fnames, executor)
+
+
+def _count_solving_tasks(fnames, executor):
+    """Returns sorted numbers of tasks solved by each action in the files."""
+    # Decompression dominates, so load the files in parallel and count solved
+    # tasks per action without stacking them into a matrix. Files are loaded
+    # in batches of _NUM_LOAD_WORKERS to bound the number of loaded columns
+    # kept in memory. print_stats shares one executor across templates and
+    # handles them one at a time, so the bound holds for the whole run.
+    num_solved = None
+    for start in range(0, len(fnames), _NUM_LOAD_WORKERS):
+        batch = fnames[start:start + _NUM_LOAD_WORKERS]
+        for actions in executor.map(joblib.load, batch):
+            if num_solved is None:
+                num_solved = np.zeros(len(actions), dtype=np.int32)
+            num_solved += actions > 0
     return sorted(num_solved.tolist(), reverse=True)
 
 
@@ -50,15 +73,11 @@ def compute_power_of_solutions(template_eval, template_tasks, tier):
 
     Solution power is how many tasks an action solves.
     """
-    template_tasks = set(template_tasks)
     actions_on_tasks = template_eval['solution_power'][tier]['actions_on_tasks']
     task_ids = template_eval['solution_power'][tier]['task_ids']
-    indicies = np.array(
-        [i for i in range(len(task_ids)) if task_ids[i] in template_tasks])
-    actions_template_tasks = actions_on_tasks.take(indicies, axis=1)
-    solves = actions_template_tasks.sum(axis=1)
-    solves.sort()
-    return solves[::-1].tolist()
+    is_template_task = np.isin(np.asarray(task_ids), list(template_tasks))
+    solves = actions_on_tasks[:, is_template_task].sum(axis=1)
+    return np.sort(solves)[::-1].tolist()
 
 
 def print_stats(template_tier_pairs, all_task_ids, use_partial_cache):
@@ -73,34 +92,59 @@ def print_stats(template_tier_pairs, all_task_ids, use_partial_cache):
           *percent_thresholds,
           sep='\t')
 
-    executor = concurrent.futures.ProcessPoolExecutor()
-    all_solution_powers = []
-    for template_id, tier in template_tier_pairs:
-        template_tasks = [
-            task_id for task_id in all_task_ids
-            if task_id.startswith(template_id)
-        ]
-        if use_partial_cache:
-            future = executor.submit(compute_cache_power_of_solutions,
-                                     template_id, template_tasks, tier)
-        else:
-            eval_stats = all_eval_stats[template_id]
-            future = executor.submit(compute_power_of_solutions, eval_stats,
+    if use_partial_cache:
+        # Cache files of each template are loaded in parallel, so templates
+        # are processed one by one to keep a single bounded pool of loaders.
+        with concurrent.futures.ThreadPoolExecutor(
+                _NUM_LOAD_WORKERS) as executor:
+            for template_id, tier in template_tier_pairs:
+                template_tasks = _get_template_tasks(template_id, all_task_ids)
+                _print_row(
+                    template_id, tier, len(template_tasks),
+                    compute_cache_power_of_solutions(template_id,
+                                                     template_tasks, tier,
+                                                     executor))
+        return
+
+    max_workers = min(len(template_tier_pairs), os.cpu_count() or 1) or 1
+    with concurrent.futures.ProcessPoolExecutor(max_workers) as executor:
+        # Only a bounded window of templates is submitted at a time so that
+        # eval stats are not pickled and queued for all templates up front.
+        # Rows are printed in submission order to keep the output sorted.
+        pending = collections.deque()
+
+        def print_next_row():
+            template_id, tier, num_tasks, future = pending.popleft()
+            _print_row(template_id, tier, num_tasks, future.result())
+
+        for template_id, tier in template_tier_pairs:
+            if len(pending) >= 2 * max_workers:
+                print_next_row()
+            template_tasks = _get_template_tasks(template_id, all_task_ids)
+            future = executor.submit(compute_power_of_solutions,
+                                     all_eval_stats[template_id],
                                      template_tasks, tier)
-        all_solution_powers.append((template_id, tier, future))
-
-    for template_id, tier, future in all_solution_powers:
-        solution_powers = future.result()
-        num_solved = []
-        for threshold in THRESHOLDS:
-            num_solved.append(
-                sum(1 for i in solution_powers
-                    if i >= threshold * len(template_tasks)))
-        print(template_id,
-              '%10s' % tier,
-              '%10s' % len(solution_powers),
-              *num_solved,
-              sep='\t')
+            pending.append((template_id, tier, len(template_tasks), future))
+        while pending:
+            print_next_row()
+
+
+def _get_template_tasks(template_id, all_task_ids):
+    return [
+        task_id for task_id in all_task_ids if task_id.startswith(template_id)
+    ]
+
+
+def _print_row(template_id, tier, num_tasks, solution_powers):
+    num_solved = []
+    for threshold in THRESHOLDS:
+        num_solved.append(
+            sum(1 for i in solution_powers if i >= threshold * num_tasks))
+    print(template_id,
+          '%10s' % tier,
+          '%10s' % len(solution_powers),
+          *num_solved,
+          sep='\t')
 
 
 def main(template_id, tier, use_partial_cache):
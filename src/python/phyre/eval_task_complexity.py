@@ -24,7 +24,6 @@ To compute the stats run:
 import collections
 import enum
 import functools
-import itertools
 import json
 import logging
 import multiprocessing
@@ -34,7 +33,8 @@ import signal
 import sys
 
 import joblib
-import scipy.stats
+import numpy as np
+from scipy.special import bdtr, bdtrc
 
 import phyre.action_mappers
 import phyre.action_simulator
@@ -50,6 +50,12 @@ NOT_SOLVED = phyre.action_simulator.SimulationStatus.NOT_SOLVED
 UNSTABLY_SOLVED = phyre.action_simulator.SimulationStatus.UNSTABLY_SOLVED
 STABLY_SOLVED = phyre.action_simulator.SimulationStatus.STABLY_SOLVED
 SOLVED = phyre.action_simulator.SimulationStatus.SOLVED
+# Workers return status counts as an array indexed by status - _MIN_STATUS.
+_STATUSES = tuple(sorted(phyre.action_simulator.SimulationStatus))
+_MIN_STATUS = int(_STATUSES[0])
+# Status counts in TaskEvaller state and eval files are keyed by int(status).
+_STATUS_KEYS = tuple(int(status) for status in _STATUSES)
+_INVALID_INPUT_COLUMN = _STATUSES.index(INVALID_INPUT)
 
 MIN_VALID_ATTEMPTS = 10000
 # Tasks that have a probability to be solved that is likely to be higher than
@@ -93,8 +99,23 @@ class LoadingMode(enum.Enum):
     FULL = enum.auto()
 
 
-def _worker(args):
-    return _eval_single_task(*args)
+# Tasks to evaluate in a TaskEvaller worker process keyed by task id. Set once
+# per process so that jobs only need to carry task ids.
+_WORKER_TASKS = None
+# Action pools keyed by (tier, pool index). Pools depend only on the tier, so
+# they are shared between tasks evaluated in a worker process.
+_ACTION_POOLS = {}
+_MAX_CACHED_ACTION_POOLS = 8
+
+
+def _init_worker(task_id_to_tasks):
+    global _WORKER_TASKS
+    _WORKER_TASKS = task_id_to_tasks
+
+
+@functools.lru_cache(maxsize=8)
+def _get_action_simulator(task_id, action_tier_name):
+    return phyre.ActionSimulator([_WORKER_TASKS[task_id]], action_tier_name)
 
 
 def _get_actions(action_simulator, start, num_actions):
@@ -102,35 +123,56 @@ def _get_actions(action_simulator, start, num_actions):
     assert (start + num_actions - 1) // ACTION_POOL_SIZE == action_pool, (
         ACTION_POOL_SIZE, start, num_actions)
 
-    actions = action_simulator.build_discrete_action_space(ACTION_POOL_SIZE,
-                                                           seed=1000 +
-                                                           action_pool)
-    actions = actions[start % ACTION_POOL_SIZE:][:num_actions]
-    return actions
-
-
-def _eval_single_task(task, action_tier_name, start, num_attempts):
-    """Evalute the task on attmepts random action from tier."""
-    task_id = task.taskId
-    action_simulator = phyre.ActionSimulator([task], action_tier_name)
-    actions = _get_actions(action_simulator, start, num_attempts)
-    statuses = collections.defaultdict(int)
-    stable_solutions, unstable_solutions = [], []
-    for action in actions:
-        status = action_simulator.simulate_action(0,
-                                                  action,
-                                                  need_images=False,
-                                                  stable=True).status
-        statuses[status] += 1
-        if status == STABLY_SOLVED:
-            stable_solutions.append(action.tolist())
-        if status == UNSTABLY_SOLVED:
-            unstable_solutions.append(action.tolist())
-    return dict(task_id=task_id,
-                tier=action_tier_name,
-                stable_solutions=stable_solutions[:MAX_SOLUTIONS_TO_KEEP],
-                unstable_solutions=unstable_solutions[:MAX_SOLUTIONS_TO_KEEP],
-                statuses=statuses)
+    key = (action_simulator.tier, action_pool)
+    if key not in _ACTION_POOLS:
+        if len(_ACTION_POOLS) >= _MAX_CACHED_ACTION_POOLS:
+            _ACTION_POOLS.clear()
+        _ACTION_POOLS[key] = action_simulator.build_discrete_action_space(
+            ACTION_POOL_SIZE, seed=1000 + action_pool)
+    # A view into the cached pool, the pool itself is never copied.
+    offset = start % ACTION_POOL_SIZE
+    return _ACTION_POOLS[key][offset:offset + num_actions]
+
+
+def _eval_single_task(task_id, action_tier_name, starts, num_attempts):
+    """Evalute the task on attmepts random action from tier.
+
+    Evaluates num_attempts actions from each of starts and returns a list of
+    results for each start.
+    """
+    action_simulator = _get_action_simulator(task_id, action_tier_name)
+    results = []
+    for start in starts:
+        actions = _get_actions(action_simulator, start, num_attempts)
+        statuses = []
+        stable_solutions, unstable_solutions = [], []
+        for action in actions:
+            status = action_simulator.simulate_action(0,
+                                                      action,
+                                                      need_images=False,
+                                                      stable=True).status
+            statuses.append(status)
+            if status == STABLY_SOLVED:
+                stable_solutions.append(action.tolist())
+            if status == UNSTABLY_SOLVED:
+                unstable_solutions.append(action.tolist())
+        status_counts = np.bincount(np.array(statuses, dtype=np.int64) -
+                                    _MIN_STATUS,
+                                    minlength=len(_STATUSES))
+        results.append(
+            dict(task_id=task_id,
+                 tier=action_tier_name,
+                 stable_solutions=stable_solutions[:MAX_SOLUTIONS_TO_KEEP],
+                 unstable_solutions=unstable_solutions[:MAX_SOLUTIONS_TO_KEEP],
+                 statuses=status_counts))
+    return results
+
+
+def _add_solutions(solutions, new_solutions):
+    """Adds new solutions while keeping the first MAX_SOLUTIONS_TO_KEEP."""
+    num_missing = MAX_SOLUTIONS_TO_KEEP - len(solutions)
+    if num_missing > 0 and new_solutions:
+        solutions.extend(new_solutions[:num_missing])
 
 
 def compute_flags(tier, status_counts):
@@ -139,17 +181,22 @@ def compute_flags(tier, status_counts):
     valid_attempts = total_attempts - status_counts[INVALID_INPUT]
     stable_solution_attempts = status_counts[STABLY_SOLVED]
     solution_attempts = status_counts[UNSTABLY_SOLVED] + stable_solution_attempts
+    return _compute_flags_cached(tier, total_attempts, valid_attempts,
+                                 solution_attempts, stable_solution_attempts)
+
 
+@functools.lru_cache(maxsize=100000)
+def _compute_flags_cached(tier, total_attempts, valid_attempts,
+                          solution_attempts, stable_solution_attempts):
     flags = {}
     threshold = SOLVABILITY_THRESHOLD_PROBS[tier]
     for suffix, count in [('', solution_attempts),
                           ('_stable', stable_solution_attempts)]:
-        flags[f'good{suffix}'] = scipy.stats.binom_test(
-            count, n=valid_attempts, p=threshold,
-            alternative='greater') < P_VALUE
-        flags[f'bad{suffix}'] = scipy.stats.binom_test(
-            count, n=valid_attempts, p=2 * threshold,
-            alternative='less') < P_VALUE
+        # One-sided binomial tests: P(X >= count) and P(X <= count).
+        p_greater = bdtrc(count - 1, valid_attempts, threshold) if count else 1.
+        p_less = bdtr(count, valid_attempts, 2 * threshold)
+        flags[f'good{suffix}'] = p_greater < P_VALUE
+        flags[f'bad{suffix}'] = p_less < P_VALUE
 
     if not solution_attempts:
         flags[f'impossible'] = True
@@ -181,9 +228,7 @@ class TaskEvaller():
         for tier in phyre.action_mappers.ACTION_MAPPERS:
             for task in tasks:
                 stats_per_task_tier[task.taskId, tier] = dict(
-                    status_counts={
-                        status: 0 for status in phyre.SimulationStatus
-                    },
+                    status_counts=dict.fromkeys(_STATUS_KEYS, 0),
                     solutions=[],
                     unstable_solutions=[],
                 )
@@ -194,70 +239,136 @@ class TaskEvaller():
             'stats_per_task_tier': stats_per_task_tier,
             'done_task_tier': done_task_tier
         }
-        self._pool = multiprocessing.Pool(
-            num_workers if num_workers > 0 else None)
+        self._load_status_counts()
+        self._num_workers = (num_workers if num_workers > 0 else
+                             multiprocessing.cpu_count())
+        self._pool = multiprocessing.Pool(self._num_workers,
+                                          initializer=_init_worker,
+                                          initargs=(self._task_id_to_tasks,))
 
     def __del__(self):
         self._pool.close()
 
+    def _load_status_counts(self):
+        """Builds status counts array from status_counts dicts in the state.
+
+        During evaluation status counts for each (task, tier) are kept in a row
+        of the array and are written back to the state only when needed.
+        """
+        stats_per_task_tier = self._state['stats_per_task_tier']
+        self._keys = list(stats_per_task_tier)
+        self._key_to_row = {key: i for i, key in enumerate(self._keys)}
+        self._is_ball_row = np.array([tier == 'ball' for _, tier in self._keys],
+                                     dtype=bool)
+        self._is_done_row = np.array(
+            [key in self._state['done_task_tier'] for key in self._keys],
+            dtype=bool)
+        self._status_counts = np.array(
+            [[stats['status_counts'].get(status, 0)
+              for status in _STATUSES]
+             for stats in stats_per_task_tier.values()],
+            dtype=np.int64).reshape(len(stats_per_task_tier), len(_STATUSES))
+        # Running total of simulations per (task, tier).
+        self._total_counts = self._status_counts.sum(axis=1)
+
+    def _store_status_counts(self):
+        """Writes status counts array back to status_counts dicts."""
+        for key, stats in self._state['stats_per_task_tier'].items():
+            row = self._status_counts[self._key_to_row[key]]
+            stats['status_counts'] = dict(zip(_STATUS_KEYS, row.tolist()))
+
+    def _mark_done(self, key):
+        self._state['done_task_tier'].add(key)
+        self._is_done_row[self._key_to_row[key]] = True
+
+    def _get_status_counts(self, key):
+        row = self._status_counts[self._key_to_row[key]]
+        return dict(zip(_STATUSES, row.tolist()))
+
     def step(self):
         """Schedule a chunk of evaluation jobs."""
-        done_simulations_per_task_tier = {}
-        for key, stats in self._state['stats_per_task_tier'].items():
-            if key in self._state['done_task_tier']:
-                continue
-            counts = sum(stats['status_counts'].values())
-            done_simulations_per_task_tier[key] = counts
-        num_unresolved_task_tier_pairs = len(done_simulations_per_task_tier)
+        unresolved_rows = np.flatnonzero(~self._is_done_row)
+        num_unresolved_task_tier_pairs = len(unresolved_rows)
         if self.reject_ball_solvable:
             # First compute stats for ball tier.
-            ball_only = {
-                k: v
-                for k, v in done_simulations_per_task_tier.items()
-                if k[1] == 'ball'
-            }
-            if ball_only:
-                done_simulations_per_task_tier = ball_only
-        simluation_tasks = []
-        for key in itertools.cycle(list(done_simulations_per_task_tier)):
-            start = done_simulations_per_task_tier[key]
-            done_simulations_per_task_tier[key] += self.simulate_worker_size
-            task_id, tier = key
-            simluation_tasks.append((self._task_id_to_tasks[task_id], tier,
-                                     start, self.simulate_worker_size))
-            if len(simluation_tasks) >= self.warp_size:
-                break
+            ball_only_rows = unresolved_rows[self._is_ball_row[unresolved_rows]]
+            if len(ball_only_rows):
+                unresolved_rows = ball_only_rows
+        done_simulations_per_task_tier = dict(
+            zip([self._keys[row] for row in unresolved_rows.tolist()],
+                self._total_counts[unresolved_rows].tolist()))
+        # Units are distributed round-robin over the pairs starting from the
+        # first one, i.e., each pair gets warp_size // num_pairs units and
+        # the first warp_size % num_pairs pairs get one more.
+        num_pairs = len(done_simulations_per_task_tier)
+        num_simulation_units = self.warp_size if num_pairs else 0
+        units_per_pair, num_extra_units = divmod(num_simulation_units,
+                                                 max(num_pairs, 1))
+        step_size = self.simulate_worker_size
+        starts_per_task_tier = {}
+        for i, (key, done_simulations) in enumerate(
+                done_simulations_per_task_tier.items()):
+            num_units = units_per_pair + (i < num_extra_units)
+            if num_units:
+                starts_per_task_tier[key] = list(
+                    range(done_simulations,
+                          done_simulations + num_units * step_size, step_size))
 
         logging.info(
             'Starting simulation chunk with %d items. Total unresolved tasks:'
-            ' %s. Simulations_done: %d', len(simluation_tasks),
-            num_unresolved_task_tier_pairs,
-            sum(
-                sum(x['status_counts'].values())
-                for x in self._state['stats_per_task_tier'].values()))
-
-        for result in self._pool.imap(_worker, simluation_tasks):
-            key = (result['task_id'], result['tier'])
-            if key in self._state['done_task_tier']:
-                # We scheduled a simulation task, but already got enough data.
-                # So just ignoring this bit to be agnostic of warp_size.
-                continue
-            # Note, we may "overshoot" here: update stats that are already complete.
-            stats = self._state['stats_per_task_tier'][key]
-            for status, count in result['statuses'].items():
-                stats['status_counts'][status] += count
-            stats['solutions'].extend(result['stable_solutions'])
-            del stats['solutions'][MAX_SOLUTIONS_TO_KEEP:]
-            stats['unstable_solutions'].extend(result['unstable_solutions'])
-            del stats['unstable_solutions'][MAX_SOLUTIONS_TO_KEEP:]
-            self._update_done_stats(*key)
+            ' %s. Simulations_done: %d', num_simulation_units,
+            num_unresolved_task_tier_pairs, self._total_counts.sum())
+
+        # Consecutive units of the same task and tier are evaluated by a single
+        # job to share the simulator and the action pools. Jobs are kept small
+        # enough to have a few jobs per worker for load balancing.
+        units_per_job = max(1, num_simulation_units // (4 * self._num_workers))
+        simulation_jobs = []
+        for (task_id, tier), starts in starts_per_task_tier.items():
+            for i in range(0, len(starts), units_per_job):
+                simulation_jobs.append(
+                    (task_id, tier, starts[i:i + units_per_job],
+                     self.simulate_worker_size))
+
+        # Jobs are submitted with a bounded number in flight and results are
+        # processed in submission order. Jobs for (task, tier) pairs that got
+        # enough data in the meantime are dropped instead of simulated.
+        pending_jobs = collections.deque(simulation_jobs)
+        in_flight = collections.deque()
+        while True:
+            while pending_jobs and len(in_flight) < 2 * self._num_workers:
+                job = pending_jobs.popleft()
+                if job[:2] not in self._state['done_task_tier']:
+                    in_flight.append(
+                        self._pool.apply_async(_eval_single_task, job))
+            if not in_flight:
+                break
+            for result in in_flight.popleft().get():
+                key = (result['task_id'], result['tier'])
+                if key in self._state['done_task_tier']:
+                    # We scheduled a simulation task, but already got enough
+                    # data. So just ignoring this bit to be agnostic of
+                    # warp_size.
+                    continue
+                # Note, we may "overshoot" here: update stats that are already
+                # complete.
+                stats = self._state['stats_per_task_tier'][key]
+                row = self._key_to_row[key]
+                self._status_counts[row] += result['statuses']
+                self._total_counts[row] += result['statuses'].sum()
+                _add_solutions(stats['solutions'], result['stable_solutions'])
+                _add_solutions(stats['unstable_solutions'],
+                               result['unstable_solutions'])
+                self._update_done_stats(*key)
 
         return self.done()
 
     def _update_done_stats(self, task_id, action_tier):
         """Update a set of "done" tasks after new data for task_id and action_tier."""
         key = (task_id, action_tier)
-        status_counts = self._state['stats_per_task_tier'][key]['status_counts']
+        if key in self._state['done_task_tier']:
+            return
+        status_counts = self._get_status_counts(key)
 
         valid_attempts = sum(
             status_counts.values()) - status_counts[INVALID_INPUT]
@@ -278,7 +389,7 @@ class TaskEvaller():
                 status_counts[STABLY_SOLVED] < MIN_SOLUTIONS):
             return
 
-        self._state['done_task_tier'].add(key)
+        self._mark_done(key)
 
         logging.info('Done simulation for %s. Stats: %s. Flags: %s', key,
                      status_counts, flags)
@@ -294,7 +405,7 @@ class TaskEvaller():
                 logging.info(
                     'Removing %s. Solved by ball and reject_ball_solvable is'
                     ' True', tier_key)
-                self._state['done_task_tier'].add(tier_key)
+                self._mark_done(tier_key)
 
     def done(self):
         """Checks whether evaluation for all jobs is done."""
@@ -304,6 +415,7 @@ class TaskEvaller():
     def result(self):
         """Returns evaluation results."""
         assert self.done()
+        self._store_status_counts()
         return self._state['stats_per_task_tier']
 
     def maybe_load(self, checkpoint_path):
@@ -312,17 +424,26 @@ class TaskEvaller():
             logging.info('Loading %s', checkpoint_path)
             with open(checkpoint_path, 'rb') as stream:
                 self._state = pickle.load(stream)
-            # Re-compute done_task_tier.
+            self._load_status_counts()
+            valid_attempts = (self._total_counts -
+                              self._status_counts[:, _INVALID_INPUT_COLUMN])
+            has_enough_attempts = (valid_attempts
+                                   >= self.min_valid_attempts).tolist()
+            # Re-compute done_task_tier. Only pairs with enough valid attempts
+            # may be done, so others are skipped without computing flags.
             self._state['done_task_tier'] = set()
-            for key in self._state['stats_per_task_tier']:
-                self._update_done_stats(*key)
+            self._is_done_row[:] = False
+            for key, row in self._key_to_row.items():
+                if has_enough_attempts[row]:
+                    self._update_done_stats(*key)
 
     def maybe_save(self, checkpoint_path):
         """If checkpoint is provided will save evaluation state."""
         if checkpoint_path is not None:
+            self._store_status_counts()
             tmp_path = checkpoint_path + '.tmp'
             with open(tmp_path, 'wb') as stream:
-                pickle.dump(self._state, stream)
+                pickle.dump(self._state, stream, pickle.HIGHEST_PROTOCOL)
             os.rename(tmp_path, checkpoint_path)
 
 
@@ -350,10 +471,12 @@ def load_all_eval_stats(num_workers=None, mode=LoadingMode.FULL):
         for template_id in known_template_ids:
             eval_stats[template_id] = local_maybe_load_evaluation(template_id)
     else:
-        num_workers = num_workers if num_workers > 0 else None
-        with multiprocessing.Pool(num_workers) as pool:
-            eval_stats = pool.map(local_maybe_load_evaluation,
-                                  known_template_ids)
+        # Loading is dominated by reading and decompressing files, so threads
+        # are enough and the results do not need to be pickled back.
+        num_workers = num_workers if num_workers > 0 else -1
+        eval_stats = joblib.Parallel(n_jobs=num_workers, prefer='threads')(
+            joblib.delayed(local_maybe_load_evaluation)(template_id)
+            for template_id in known_template_ids)
         eval_stats = dict(zip(known_template_ids, eval_stats))
 
     eval_stats = {k: v for k, v in eval_stats.items() if v is not None}
@@ -588,9 +711,6 @@ def main(template_id, log_dir, force, interactive, **simulate_kwargs):
     eval_stats_task_tier = evaller.result()
     eval_stats = collections.defaultdict(dict)
     for (task_id, tier), stats in eval_stats_task_tier.items():
-        stats['status_counts'] = {
-            int(k): v for k, v in stats['status_counts'].items()
-        }
         eval_stats[task_id][tier] = stats
 
     eval_fpath = get_evaluation_path(task_path)
@@ -632,7 +752,8 @@ def main(template_id, log_dir, force, interactive, **simulate_kwargs):
         # Serialize to string first to type-check.
         json.dumps(eval_data, indent=2)
         logging.info('Saving %s', eval_fpath)
-        joblib.dump(eval_data, eval_fpath, compress=('lzma', 6))
+        # Low lzma preset: much faster to write and the file format is unchanged.
+        joblib.dump(eval_data, eval_fpath, compress=('lzma', 1))
         # Meta is written at the end.
         with open(eval_meta_fpath, 'w') as stream:
             json.dump(meta, stream)
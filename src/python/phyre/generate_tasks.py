@@ -34,6 +34,14 @@ def _save_task(task_id, thrift_task, target_folder):
     return task_id
 
 
+def _save_task_collection(tasks, path):
+    task_collection = task_if.TaskCollection(
+        tasks=sorted(tasks, key=lambda task: task.taskId))
+    with lzma.open(path, 'w', preset=1) as stream:
+        stream.write(phyre.simulator.serialize(task_collection))
+    return path
+
+
 def main(src_folder, target_folder, save_single_pickle, with_eval_stats):
     if not os.path.exists(target_folder):
         os.makedirs(target_folder)
@@ -48,12 +56,14 @@ def main(src_folder, target_folder, save_single_pickle, with_eval_stats):
         per_file = collections.defaultdict(list)
         for task in tasks.values():
             per_file[phyre.loader.task_id_to_pickle(task.taskId)].append(task)
-        for fname, task_collection in per_file.items():
-            task_collection = task_if.TaskCollection(
-                tasks=sorted(task_collection, key=lambda task: task.taskId))
-            path = os.path.join(target_folder, fname)
-            with lzma.open(path, 'w') as stream:
-                stream.write(phyre.simulator.serialize(task_collection))
+        with concurrent.futures.ProcessPoolExecutor() as executor:
+            futures = [
+                executor.submit(_save_task_collection, task_collection,
+                                os.path.join(target_folder, fname))
+                for fname, task_collection in per_file.items()
+            ]
+            for future in futures:
+                print("Saved", future.result())
     else:
         with concurrent.futures.ThreadPoolExecutor(max_workers=5) as executor:
             futures = [
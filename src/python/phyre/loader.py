@@ -19,8 +19,11 @@ with build_task callable that returns a list of tasks.
 """
 from typing import Any, Dict, Mapping, Iterable, Optional, Sequence, Tuple
 import collections
+import concurrent.futures
+import functools
 import importlib.util
 import lzma
+import mmap
 import os
 import pickle
 import re
@@ -31,6 +34,9 @@ import phyre.simulator
 
 TaskScript = Any
 
+# Loaded task script modules keyed by (path, modification time in ns).
+_TASK_SCRIPT_CACHE: Dict[Tuple[str, int], TaskScript] = {}
+
 
 def load_task_script(template_id_or_path: str) -> Tuple[str, str, TaskScript]:
     """Loads task script given either template_id or full path to the scripts.
@@ -78,22 +84,38 @@ def load_task_scripts_from_folder(
     # We need some fake uniq module name to mount the modules in.
     path_slug = re.sub('[^a-zA-Z0-9]', '_',
                        os.path.realpath(task_folder)).strip('_')
+    # List of (file name, modification time) for scripts to load.
+    scripts = []
+    if template_id_list is not None:
+        # Only look up the requested scripts instead of listing the folder.
+        for fname in sorted(
+            {f'task{template_id}.py' for template_id in template_id_list}):
+            try:
+                stat = os.stat(os.path.join(task_folder, fname))
+            except FileNotFoundError:
+                continue
+            scripts.append((fname, stat.st_mtime_ns))
+    else:
+        with os.scandir(task_folder) as dir_entries:
+            scripts = sorted(
+                (entry.name, entry.stat().st_mtime_ns)
+                for entry in dir_entries
+                if entry.name.startswith('task') and entry.name.endswith('.py'))
     tasks = []
-    for fname in sorted(os.listdir(task_folder)):
-        if not fname.startswith('task') or not fname.endswith('.py'):
-            continue
+    for fname, mtime_ns in scripts:
         template_id = fname[4:-3]
-        if (template_id_list is not None and
-                template_id not in template_id_list):
-            continue
         fpath = os.path.join(task_folder, fname)
-        spec = importlib.util.spec_from_file_location(
-            f'{path_slug}.task{template_id}', fpath)
-        module = importlib.util.module_from_spec(spec)
-        spec.loader.exec_module(module)
-        if not hasattr(module, 'build_task'):
-            raise RuntimeError(f'Loaded {fname} from {task_folder}, but'
-                               ' haven\'t found "build_task" method')
+        cache_key = (fpath, mtime_ns)
+        module = _TASK_SCRIPT_CACHE.get(cache_key)
+        if module is None:
+            spec = importlib.util.spec_from_file_location(
+                f'{path_slug}.task{template_id}', fpath)
+            module = importlib.util.module_from_spec(spec)
+            spec.loader.exec_module(module)
+            if not hasattr(module, 'build_task'):
+                raise RuntimeError(f'Loaded {fname} from {task_folder}, but'
+                                   ' haven\'t found "build_task" method')
+            _TASK_SCRIPT_CACHE[cache_key] = module
         tasks.append((template_id, fpath, module))
     return tasks
 
@@ -120,9 +142,11 @@ def load_tasks_from_folder(task_folder: str = str(
         OrderedDict: task_id -> Task, where task_id has format
             <template_id> ":" <task_id>.
     """
+    if task_id_list is not None:
+        task_id_list = frozenset(task_id_list)
     if template_id_list is None and task_id_list is not None:
         template_id_list = frozenset(
-            task_id.split(':')[0] for task_id in task_id_list)
+            task_id.partition(':')[0] for task_id in task_id_list)
     task_scripts = load_task_scripts_from_folder(task_folder, template_id_list)
 
     tasks = collections.OrderedDict()
@@ -153,6 +177,30 @@ def task_id_to_pickle(task_id):
         return f'tasks{prefix}.bin.lzma'
 
 
+def _load_task_collection(path) -> task_if.TaskCollection:
+    # Deserialize on every call so that callers never share mutable tasks.
+    return phyre.simulator.deserialize(
+        task_if.TaskCollection(),
+        _read_task_collection(str(path), os.path.getmtime(path)))
+
+
+# Decompressed dumps are cached until they are modified on disk. They take
+# up to tens of MB each, so only as many are kept as the default task dir has.
+@functools.lru_cache(maxsize=2)
+def _read_task_collection(path: str, mtime: float) -> bytes:
+    del mtime  # Only used as a part of the cache key.
+    # Decompress in a single call rather than via lzma.open(), which decodes
+    # small chunks and joins them. The compressed dump is mapped rather than
+    # read to skip copying it into a bytes object first.
+    with open(path, 'rb') as stream:
+        if not os.fstat(stream.fileno()).st_size:
+            # Empty files cannot be mapped.
+            raise lzma.LZMAError(f'Empty task dump: {path}')
+        with mmap.mmap(stream.fileno(), 0,
+                       access=mmap.ACCESS_READ) as compressed:
+            return lzma.decompress(compressed)
+
+
 def load_compiled_task_dict(task_ids: Optional[Sequence[str]] = None
                            ) -> Dict[str, task_if.Task]:
     """Helper function to load the default task dump."""
@@ -160,13 +208,14 @@ def load_compiled_task_dict(task_ids: Optional[Sequence[str]] = None
         fnames = frozenset(map(task_id_to_pickle, task_ids))
         paths = [phyre.settings.TASK_DIR / fname for fname in fnames]
     else:
-        paths = phyre.settings.TASK_DIR.glob("*.bin.lzma")
+        paths = list(phyre.settings.TASK_DIR.glob("*.bin.lzma"))
     data = {}
-    for path in paths:
-        with lzma.open(path) as stream:
-            collection = phyre.simulator.deserialize(task_if.TaskCollection(),
-                                                     stream.read())
-        data.update({task.taskId: task for task in collection.tasks})
+    # Dumps are independent, so load them concurrently. Decompression releases
+    # the GIL and threads avoid pickling the tasks back.
+    max_workers = min(len(paths), os.cpu_count() or 1) or 1
+    with concurrent.futures.ThreadPoolExecutor(max_workers) as executor:
+        for collection in executor.map(_load_task_collection, paths):
+            data.update({task.taskId: task for task in collection.tasks})
     if task_ids is not None:
         missing = frozenset(task_ids).difference(data)
         if missing:
@@ -178,11 +227,8 @@ def load_compiled_template_dict() -> Dict[str, Dict[str, task_if.Task]]:
     """Helper function to load the task dump, mapping templates tasks."""
     all_tasks = load_compiled_task_dict()
     template_ids = {}
-    for task in all_tasks:
-        template = task.split(':')[0]
-        d = template_ids.get(template, {})
-        d[task] = all_tasks[task]
-        template_ids[template] = d
+    for task_id, task in all_tasks.items():
+        template_ids.setdefault(task_id.partition(':')[0], {})[task_id] = task
     return template_ids
 
 
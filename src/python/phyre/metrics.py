@@ -15,6 +15,7 @@
 
 """
 from typing import (Any, Callable, Dict, List, Sequence, Tuple, Union)
+import array
 import collections
 import functools
 import hashlib
@@ -22,9 +23,12 @@ import itertools
 import logging
 import math
 
+import numpy as np
+
 import phyre.action_mappers
 import phyre.action_simulator
 import phyre.loader
+import phyre.settings
 import phyre.util
 
 MAIN_EVAL_SETUPS: Sequence[str] = (
@@ -120,38 +124,81 @@ def _register_multi_tier_eval_setup_builder(func: Callable) -> Callable:
 
 def get_task_ids_in_tier(tier_name):
     """Returns a list of all task_ids in iter."""
+    return list(
+        _get_task_ids_per_tier(_get_task_dump_key()).get(tier_name.upper(), ()))
+
+
+def _get_task_per_tpl(tier_name):
+    """Returns a dict template_id -> sorted task ids for templates in tier."""
+    return dict(
+        _get_task_ids_per_tier_tpl(_get_task_dump_key()).get(
+            tier_name.upper(), {}))
+
+
+def _get_task_dump_key() -> Tuple[str, Tuple[Tuple[str, int], ...]]:
+    """Returns TASK_DIR and modification times of its dumps as a cache key."""
+    task_dir = phyre.settings.TASK_DIR
+    return str(task_dir), tuple(
+        sorted((path.name, path.stat().st_mtime_ns)
+               for path in task_dir.glob('*.bin.lzma')))
+
+
+@functools.lru_cache(maxsize=1)
+def _get_task_ids_per_tier(task_dump_key) -> Dict[str, Tuple[str, ...]]:
+    """Maps tiers to sorted ids of tasks in templates with only that tier."""
+    return {
+        tier:
+            tuple(sorted(itertools.chain.from_iterable(tasks_per_tpl.values())))
+        for tier, tasks_per_tpl in _get_task_ids_per_tier_tpl(
+            task_dump_key).items()
+    }
+
+
+@functools.lru_cache(maxsize=1)
+def _get_task_ids_per_tier_tpl(
+        task_dump_key) -> Dict[str, Dict[str, Tuple[str, ...]]]:
+    """Maps tiers to template_id -> sorted task ids for single tier templates.
+
+    Templates are listed in sorted order. task_dump_key is only used to
+    invalidate the cache once TASK_DIR or its dumps change.
+    """
+    del task_dump_key  # Only used as a part of the cache key.
     # dict of dicts: template_id -> task_id -> tier.
     template_task_tiers = collections.defaultdict(dict)
     for task_id, task in phyre.loader.load_compiled_task_dict().items():
-        template_id = task_id.split(':')[0]
+        template_id = task_id.partition(':')[0]
         template_task_tiers[template_id][task_id] = task.tier
 
-    selected_task_ids = set()
-    tier_name = tier_name.upper()
-    for template_id, task_to_tier in template_task_tiers.items():
+    task_ids_per_tier_tpl = collections.defaultdict(dict)
+    for template_id, task_to_tier in sorted(template_task_tiers.items()):
         tiers = frozenset(task_to_tier.values())
-        if len(tiers) == 1 and next(iter(tiers)) == tier_name:
-            selected_task_ids.update(task_to_tier)
-    return sorted(selected_task_ids)
+        if len(tiers) == 1:
+            task_ids_per_tier_tpl[next(iter(tiers))][template_id] = tuple(
+                sorted(task_to_tier))
+    return dict(task_ids_per_tier_tpl)
 
 
 def create_dev_set(eval_setup, train_share=TRAIN_SHARE, seed=0):
     """Create a new train/test split from a train part of another eval setup."""
     dev_eval_setup = []
     for train_task_ids, _ in eval_setup:
-        train_task_ids = phyre.util.stable_shuffle(train_task_ids,
-                                                   f'make_dev{seed}')
+        train_task_ids = _stable_shuffle(train_task_ids, f'make_dev{seed}')
         num_train = int(len(train_task_ids) * train_share)
         train, dev = train_task_ids[:num_train], train_task_ids[num_train:]
         dev_eval_setup.append((train, [dev]))
     return dev_eval_setup
 
 
-def _get_task_per_tpl(task_ids):
-    tasks_per_tpl = collections.defaultdict(list)
-    for task_id in task_ids:
-        tasks_per_tpl[task_id.split(':')[0]].append(task_id)
-    return tasks_per_tpl
+def _stable_shuffle(strings, salt):
+    """Same as phyre.util.stable_shuffle, but caches the permutations."""
+    return list(_stable_shuffle_cached(tuple(strings), salt))
+
+
+# Builders shuffle each template separately, so keep enough permutations.
+@functools.lru_cache(maxsize=4096)
+def _stable_shuffle_cached(strings: Tuple[str, ...],
+                           salt: str) -> Tuple[str, ...]:
+    return tuple(phyre.util.stable_shuffle(strings, salt))
 
 
 @_register_eval_setup_builder
@@ -161,12 +208,11 @@ def ball_single_instance(max_per_tpl=10) -> EvalSetup:
     The number of tasks that is randomly picked from each template is limited to
     10.
     """
-    task_ids = get_task_ids_in_tier('ball')
-    tasks_per_tpl = _get_task_per_tpl(task_ids)
+    tasks_per_tpl = _get_task_per_tpl('ball')
     eval_setup = []
     for _, task_ids_group in sorted(tasks_per_tpl.items()):
-        eval_task_ids = phyre.util.stable_shuffle(
-            task_ids_group, 'ball_online_ind_tasks')[:max_per_tpl]
+        eval_task_ids = _stable_shuffle(task_ids_group,
+                                        'ball_online_ind_tasks')[:max_per_tpl]
         for task_id in eval_task_ids:
             eval_groups = ((task_id,),)
             train_set = ()
@@ -184,18 +230,15 @@ def ball_single_instance_tiny() -> EvalSetup:
 @_register_eval_setup_builder
 def ball_phyre_to_tools(seed=1, dev_seed=None) -> EvalSetup:
     """A set of train have train and PHYRE-B and val and test in TOOLS."""
-    tool_task_ids = get_task_ids_in_tier("VIRTUAL_TOOLS")
-    tasks_per_tpl = collections.defaultdict(list)
-    for task_id in tool_task_ids:
-        tasks_per_tpl[task_id.split(':')[0]].append(task_id)
+    tasks_per_tpl = _get_task_per_tpl("VIRTUAL_TOOLS")
 
-    key_order = phyre.util.stable_shuffle(tasks_per_tpl,
-                                          f'virtual_tools_{seed}')
+    key_order = _stable_shuffle(tasks_per_tpl, f'virtual_tools_{seed}')
     if dev_seed is not None:
         key_order = key_order[::2]
     else:
         key_order = key_order[1::2]
-    eval_ids = sum([tasks_per_tpl[k] for k in key_order], [])
+    eval_ids = list(
+        itertools.chain.from_iterable(tasks_per_tpl[k] for k in key_order))
 
     # Always use train+val as train set from cross-dataset.
     [(train_ids, _)] = _cross_template("BALL", seed=seed)
@@ -209,23 +252,20 @@ def ball_phyre_to_tools(seed=1, dev_seed=None) -> EvalSetup:
 def _cross_template(tier, seed=1, dev_seed=None,
                     train_share=TRAIN_SHARE) -> EvalSetup:
     """A set of train groups with half templates in train and half in test."""
-    task_ids = get_task_ids_in_tier(tier)
-    tasks_per_tpl = collections.defaultdict(list)
-    for task_id in task_ids:
-        tasks_per_tpl[task_id.split(':')[0]].append(task_id)
-    key_order = phyre.util.stable_shuffle(list(tasks_per_tpl),
-                                          f'ball_cross_template_half_{seed}')
+    tasks_per_tpl = _get_task_per_tpl(tier)
+    key_order = _stable_shuffle(list(tasks_per_tpl),
+                                f'ball_cross_template_half_{seed}')
     train_size = int(round(len(key_order) * train_share))
     if dev_seed is not None:
         key_order = key_order[:train_size]
-        key_order = phyre.util.stable_shuffle(
-            key_order, f'dev_ball_cross_template_half_{dev_seed}')
+        key_order = _stable_shuffle(key_order,
+                                    f'dev_ball_cross_template_half_{dev_seed}')
         train_size = int(len(key_order) * train_share)
     tasks_per_tpl = [tasks_per_tpl[key] for key in key_order]
     train, test = tasks_per_tpl[:train_size], tasks_per_tpl[train_size:]
     eval_setup = []
-    train_ids = sum(train, [])
-    eval_ids = sum(test, [])
+    train_ids = list(itertools.chain.from_iterable(train))
+    eval_ids = list(itertools.chain.from_iterable(test))
     train_group = (tuple(train_ids), [tuple(eval_ids)])
     eval_setup.append(train_group)
     return eval_setup
@@ -235,12 +275,11 @@ def _cross_template(tier, seed=1, dev_seed=None,
 def _single_template(tier, seed=1, dev_seed=None,
                      train_share=TRAIN_SHARE) -> EvalSetup:
     """Each template is a separate group."""
-    task_ids = get_task_ids_in_tier(tier)
-    tasks_per_tpl = _get_task_per_tpl(task_ids)
+    tasks_per_tpl = _get_task_per_tpl(tier)
     eval_setup = []
     for _, task_ids_group in sorted(tasks_per_tpl.items()):
-        task_ids_group = phyre.util.stable_shuffle(
-            task_ids_group, f'ball_online_ind_tasks{seed}')
+        task_ids_group = _stable_shuffle(task_ids_group,
+                                         f'ball_online_ind_tasks{seed}')
         train_size = int(round(len(task_ids_group) * train_share))
         if not train_size:
             continue
@@ -276,35 +315,74 @@ def _within_template(tier, seed=1, dev_seed=None,
 
 def _normalize_sumulation_status(status: SimulationStatusLike
                                 ) -> phyre.action_simulator.SimulationStatus:
+    if type(status) is phyre.action_simulator.SimulationStatus:
+        return status
     if isinstance(status, str):
         status = int(status)
     return phyre.action_simulator.SimulationStatus(status)
 
 
+# Weights of attempts in AUCCESS and their running sums.
+_AUCCESS_WEIGHTS = np.array([
+    math.log(up_to + 1) - math.log(up_to)
+    for up_to in range(1, MAX_TEST_ATTEMPTS + 1)
+])
+_AUCCESS_DENOMS = np.cumsum(_AUCCESS_WEIGHTS)
+_STATUS_VALUES = np.array(
+    [int(status) for status in phyre.action_simulator.SimulationStatus])
+_INVALID_INPUT = int(phyre.action_simulator.SimulationStatus.INVALID_INPUT)
+# Statuses starting from this one are solved.
+_SOLVED = int(phyre.action_simulator.SimulationStatus.SOLVED)
+
+
 def compute_metrics(raw_simulation_log: SimulationLog) -> Metrics:
     assert isinstance(raw_simulation_log,
                       (tuple, list)), type(raw_simulation_log)
-    if not raw_simulation_log:
-        logger.warning('Computing metrics for empty evaluation log!')
-    else:
+    if raw_simulation_log:
         assert len(raw_simulation_log[0]) == 2, raw_simulation_log[0]
 
-    simulation_log = [(task, _normalize_sumulation_status(status))
-                      for task, status in raw_simulation_log]
-    simulation_log = [(task, _normalize_sumulation_status(status))
-                      for task, status in simulation_log
-                      if not status.is_invalid()]
-
-    attempts = collections.defaultdict(int)
-    solved_at = {}
-    first_solution_points = []
-    for attempt_index, (task, status) in enumerate(simulation_log, start=1):
-        attempts[task] += 1
-        if task not in solved_at and status.is_solved():
-            first_solution_points.append(attempt_index)
-            solved_at[task] = attempts[task]
-
-    if solved_at and max(solved_at.values()) > MAX_TEST_ATTEMPTS:
+    task_codes = {}
+    tasks = np.fromiter((task_codes.setdefault(task, len(task_codes))
+                         for task, _ in raw_simulation_log),
+                        dtype=np.int64,
+                        count=len(raw_simulation_log))
+    statuses = np.fromiter((int(status) for _, status in raw_simulation_log),
+                           dtype=np.int64,
+                           count=len(raw_simulation_log))
+    is_known_status = np.isin(statuses, _STATUS_VALUES)
+    if not is_known_status.all():
+        # Raise the same error as SimulationStatus would.
+        _normalize_sumulation_status(
+            int(statuses[np.flatnonzero(~is_known_status)[0]]))
+    return _compute_metrics(tasks, statuses)
+
+
+def _compute_metrics(tasks: np.ndarray, statuses: np.ndarray) -> Metrics:
+    """Computes metrics given arrays of int task codes and statuses."""
+    if not len(tasks):
+        logger.warning('Computing metrics for empty evaluation log!')
+    is_valid = statuses != _INVALID_INPUT
+    tasks, statuses = tasks[is_valid], statuses[is_valid]
+
+    # attempts[i] := number of attempts on tasks[i] up to and including i.
+    order = np.argsort(tasks, kind='stable')
+    sorted_tasks = tasks[order]
+    is_first = np.ones(len(tasks), dtype=bool)
+    is_first[1:] = sorted_tasks[1:] != sorted_tasks[:-1]
+    group_starts = np.flatnonzero(is_first)
+    attempts = np.empty(len(tasks), dtype=np.int64)
+    attempts[order] = np.arange(len(tasks)) - np.repeat(
+        group_starts, np.diff(np.append(group_starts, len(tasks))))
+    attempts += 1
+
+    # Index of the first solving attempt for each solved task.
+    solved_indices = np.flatnonzero(statuses >= _SOLVED)
+    _, first = np.unique(tasks[solved_indices], return_index=True)
+    first_solution_indices = np.sort(solved_indices[first])
+    solved_at = attempts[first_solution_indices]
+    first_solution_points = first_solution_indices + 1
+
+    if len(solved_at) and solved_at.max() > MAX_TEST_ATTEMPTS:
         logger.warning(
             'Used more than %d attempts at least of one of the'
             ' tasks. It most likely means a bug in evaluation loop.',
@@ -312,35 +390,26 @@ def compute_metrics(raw_simulation_log: SimulationLog) -> Metrics:
 
     # independent_solved_by[i] := how many task was solved with at most i
     # attempts on the task.
-    independent_solved_by = [0]
-    for num_attempts, group in itertools.groupby(sorted(solved_at.values())):
-        count = len(list(group))
-        if num_attempts > MAX_TEST_ATTEMPTS:
-            break
-        while len(independent_solved_by) <= num_attempts:
-            independent_solved_by.append(independent_solved_by[-1])
-        independent_solved_by[num_attempts] += count
-    while len(independent_solved_by) <= MAX_TEST_ATTEMPTS:
-        independent_solved_by.append(independent_solved_by[-1])
-
-    independent_solved_by_aucs = [0.]
-    num, denom = 0., 0.
-    for up_to in range(1, MAX_TEST_ATTEMPTS + 1):
-        weight = math.log(up_to + 1) - math.log(up_to)
-        num += weight * independent_solved_by[up_to]
-        denom += weight
-        independent_solved_by_aucs.append(num / denom)
-
-    global_solved_by = {
-        t: sum(num_attempts <= t for num_attempts in first_solution_points)
-        for t in [100, 1000, 100000]
-    }
+    independent_solved_by = np.cumsum(
+        np.bincount(solved_at[solved_at <= MAX_TEST_ATTEMPTS],
+                    minlength=MAX_TEST_ATTEMPTS + 1))
+
+    independent_solved_by_aucs = np.zeros(MAX_TEST_ATTEMPTS + 1)
+    independent_solved_by_aucs[1:] = np.cumsum(
+        _AUCCESS_WEIGHTS * independent_solved_by[1:]) / _AUCCESS_DENOMS
+
+    # first_solution_points is sorted, so counts are insertion points.
+    thresholds = [100, 1000, 100000]
+    solved_counts = np.searchsorted(first_solution_points,
+                                    thresholds,
+                                    side='right')
+    global_solved_by = dict(zip(thresholds, solved_counts.tolist()))
 
     return dict(
-        independent_solved_by=independent_solved_by,
-        independent_solved_by_aucs=independent_solved_by_aucs,
+        independent_solved_by=independent_solved_by.tolist(),
+        independent_solved_by_aucs=independent_solved_by_aucs.tolist(),
         global_solved_by=global_solved_by,
-        total_attempts=sum(attempts.values()),
+        total_attempts=len(tasks),
         total_solved=len(first_solution_points),
     )
 
@@ -360,7 +429,10 @@ def normalize_metrics(metrics: Metrics, num_tasks: int) -> Metrics:
 
 def compute_metrics_normalized(simulation_log: SimulationLog,
                                num_tasks: int) -> Metrics:
-    metrics = compute_metrics(simulation_log)
+    return _normalize_all_metrics(compute_metrics(simulation_log), num_tasks)
+
+
+def _normalize_all_metrics(metrics: Metrics, num_tasks: int) -> Metrics:
     if metrics['total_attempts'] < MAX_TEST_ATTEMPTS * num_tasks:
         logger.warning(
             'Used %f attempts per task instead of maximum allowed'
@@ -374,7 +446,9 @@ class Evaluator():
 
     def __init__(self, task_ids: Tuple[str]):
         self._task_ids = task_ids
-        self._log: EvaluationLog = []
+        # The log is stored as arrays of task indices and int statuses.
+        self._log_task_indices = array.array('i')
+        self._log_statuses = array.array('b')
         self.attempts_per_task_index: List[int] = [0] * len(task_ids)
 
     def maybe_log_attempt(self, task_index: int,
@@ -402,8 +476,8 @@ class Evaluator():
             f'{self.attempts_per_task_index[task_index]} attempts made, '
             'greater than maximum number of test attempts '
             f'{MAX_TEST_ATTEMPTS}')
-        task_id = self._task_ids[task_index]
-        self._log.append((task_id, status))
+        self._log_task_indices.append(task_index)
+        self._log_statuses.append(status)
         self.attempts_per_task_index[task_index] += 1
         return True
 
@@ -413,7 +487,18 @@ class Evaluator():
         Returns:
             Dictionary mapping metric name to computed value.
         """
-        return compute_metrics_normalized(self._log, len(self._task_ids))
+        # Attempts are grouped by task id rather than by task index.
+        task_codes = {}
+        index_to_task_code = np.fromiter(
+            (task_codes.setdefault(task_id, len(task_codes))
+             for task_id in self._task_ids),
+            dtype=np.int64,
+            count=len(self._task_ids))
+        task_indices = np.frombuffer(self._log_task_indices, dtype=np.int32)
+        metrics = _compute_metrics(
+            index_to_task_code[task_indices],
+            np.frombuffer(self._log_statuses, dtype=np.int8))
+        return _normalize_all_metrics(metrics, len(self._task_ids))
 
     # Deprecated spelling.
     def get_aucess(self, attempts: int = MAX_TEST_ATTEMPTS) -> float:
@@ -449,6 +534,13 @@ class Evaluator():
         """Returns ordered list of tasks ids."""
         return self._task_ids
 
+    @property
+    def _log(self) -> EvaluationLog:
+        return [(self._task_ids[task_index],
+                 phyre.action_simulator.SimulationStatus(status))
+                for task_index, status in zip(self._log_task_indices,
+                                              self._log_statuses)]
+
     def __len__(self) -> int:
         """Returns number of recorded attempts."""
-        return len(self._log)
+        return len(self._log_statuses)
@@ -38,8 +38,8 @@ def featurized_objects_vector_to_scene(featurized_objects: np.ndarray
     user_input = scene_if.UserInput(flattened_point_list=[],
                                     balls=[],
                                     polygons=[])
-    for features in featurized_objects:
-        object_properties = _object_features_to_values(features)
+    builders = shapes_lib.get_builders()
+    for object_properties in _objects_features_to_values(featurized_objects):
         if object_properties['user_input']:
             assert object_properties['shape_type'] == 'ball', (
                 'User input objects must be balls')
@@ -49,7 +49,7 @@ def featurized_objects_vector_to_scene(featurized_objects: np.ndarray
                                              y=object_properties['y']),
                     radius=object_properties['diameter'] / 2.0))
         else:
-            builder = shapes_lib.get_builders()[object_properties['shape_type']]
+            builder = builders[object_properties['shape_type']]
             shapes, phantom_vertices = builder.build(
                 diameter=object_properties['diameter'])
 
@@ -60,8 +60,7 @@ def featurized_objects_vector_to_scene(featurized_objects: np.ndarray
             body.set_angle(object_properties['angle'])
             body.set_color(object_properties['color'])
 
-            task.scene.bodies.append(body._thrift_body)
-            task.body_list.append(body)
+            task._register_body(body)
     scene = phyre.simulator.add_user_input_to_scene(task.scene,
                                                     user_input,
                                                     allow_occlusions=True)
@@ -84,28 +83,36 @@ def featurized_objects_vector_to_raster(featurized_objects: np.ndarray
 
 
 def _object_features_to_values(features):
+    return _objects_features_to_values(features[None])[0]
+
+
+def _objects_features_to_values(featurized_objects):
+    """Converts (num_objects, OBJECT_FEATURE_SIZE) array to a list of dicts."""
     featurized_objects = phyre.simulation.FeaturizedObjects(
         phyre.simulation.finalize_featurized_objects(
-            features[None, None, ...],
+            featurized_objects[None, ...],
             phyre.simulation.PositionShift.FROM_CENTER_OF_MASS))
-    x = featurized_objects.xs.item()
-    y = featurized_objects.ys.item()
-    angle = featurized_objects.angles.item()
-    diameter = featurized_objects.diameters.item()
-    x *= constants.SCENE_WIDTH
-    y *= constants.SCENE_HEIGHT
-    angle *= 360.
-    diameter *= constants.SCENE_WIDTH
+    xs = (featurized_objects.xs[0] * constants.SCENE_WIDTH).tolist()
+    ys = (featurized_objects.ys[0] * constants.SCENE_HEIGHT).tolist()
+    angles = (featurized_objects.angles[0] * 360.).tolist()
+    diameters = (featurized_objects.diameters * constants.SCENE_WIDTH).tolist()
+    user_input_color = shared_if.Color._VALUES_TO_NAMES[
+        shared_constants.USER_BODY_COLOR].lower()
+    dynamic_color_ids = constants.DYNAMIC_COLOR_IDS
+    color_to_id = constants.color_to_id
 
-    shape_type = featurized_objects.shapes[0].lower()
-    color = featurized_objects.colors[0].lower()
-    dynamic = constants.color_to_id(color) in constants.DYNAMIC_COLOR_IDS
-    user_input = featurized_objects.num_user_inputs == 1
-    return dict(x=x,
-                y=y,
-                angle=angle,
-                diameter=diameter,
-                dynamic=dynamic,
-                user_input=user_input,
-                color=color,
-                shape_type=shape_type)
+    values = []
+    for x, y, angle, diameter, shape, color in zip(xs, ys, angles, diameters,
+                                                   featurized_objects.shapes,
+                                                   featurized_objects.colors):
+        color = color.lower()
+        values.append(
+            dict(x=x,
+                 y=y,
+                 angle=angle,
+                 diameter=diameter,
+                 dynamic=color_to_id(color) in dynamic_color_ids,
+                 user_input=color == user_input_color,
+                 color=color,
+                 shape_type=shape.lower()))
+    return values
@@ -32,9 +32,8 @@ class PositionShift(enum.Enum):
     FROM_CENTER_OF_MASS = 2
 
 
-def _get_jar_offset(featurized_object):
-    diameter = featurized_object[
-        FeaturizedObjects._DIAMETER_INDEX] * constants.SCENE_WIDTH
+def _get_jar_offset(diameter):
+    """Returns y of the center of mass of a jar with diameter in pixels."""
     if diameter not in DIAMETER_CENTERS:
         center_x, center_y = phyre.creator.shapes.Jar.center_of_mass(**dict(
             diameter=diameter))
@@ -42,6 +41,19 @@ def _get_jar_offset(featurized_object):
     return DIAMETER_CENTERS[diameter]
 
 
+def _get_jar_offsets(jar_diameters: np.ndarray) -> np.ndarray:
+    """Returns center of mass y offsets for jars in a scene.
+
+    jar_diameters are diameters divided by SCENE_WIDTH. Centers are looked up
+    once per unique diameter.
+    """
+    diameters, diameter_indices = np.unique(jar_diameters *
+                                            constants.SCENE_WIDTH,
+                                            return_inverse=True)
+    centers = np.array([_get_jar_offset(d) for d in diameters])
+    return centers[diameter_indices]
+
+
 def finalize_featurized_objects(featurized_objects: np.ndarray,
                                 shift_direction=PositionShift.TO_CENTER_OF_MASS
                                ) -> np.ndarray:
@@ -55,6 +67,9 @@ def finalize_featurized_objects(featurized_objects: np.ndarray,
             PositionShift.TO_CENTER_OF_MASS representing the processing done
             on the array returned by the simulator.
 
+    Returns featurized_objects itself if there are no jars to shift and a
+    shifted copy otherwise.
+
     The features are by index:
         - 0: x in pixels of center of mass divided by SCENE_WIDTH
         - 1: y in pixels of center of mass divided by SCENE_HEIGHT
@@ -65,26 +80,28 @@ def finalize_featurized_objects(featurized_objects: np.ndarray,
         - 8-14: One hot encoding of object color, according to order:
             red, green, blue, purple, gray, black
     """
-    featurized_objects = np.copy(featurized_objects)
     direction = 1.0 if shift_direction == PositionShift.TO_CENTER_OF_MASS else -1.0
-    is_jar = featurized_objects[:, :, FeaturizedObjects._SHAPE_START_INDEX +
+    if not len(featurized_objects):
+        # Simulations without featurized objects have no timesteps.
+        return featurized_objects
+    # Jars are the same objects in all timesteps.
+    is_jar = featurized_objects[0, :, FeaturizedObjects._SHAPE_START_INDEX +
                                 scene_if.ShapeType.JAR - 1] == 1
-    if featurized_objects[is_jar].shape[0] > 0:
-        offsets = np.apply_along_axis(_get_jar_offset, 1,
-                                      featurized_objects[0, :, :][is_jar[0, :]])
-        offsets_expanded = np.concatenate([offsets] *
-                                          featurized_objects.shape[0],
-                                          axis=0)
-        angles = featurized_objects[is_jar][:, FeaturizedObjects.
-                                            _ANGLE_INDEX] * 2 * math.pi
-        directional_offsets = np.stack(
-            [
-                -1 * offsets_expanded * np.sin(angles),
-                offsets_expanded * np.cos(angles)
-            ],
-            axis=-1) / constants.SCENE_WIDTH * direction
-        featurized_objects[is_jar, :FeaturizedObjects.
-                           _ANGLE_INDEX] += directional_offsets
+    if not is_jar.any():
+        # Nothing to shift, so skip copying the whole array.
+        return featurized_objects
+    featurized_objects = np.copy(featurized_objects)
+    # Jar diameters do not change during a simulation, so offsets are
+    # computed once from the first timestep.
+    diameters = featurized_objects[0, is_jar, FeaturizedObjects._DIAMETER_INDEX]
+    offsets = _get_jar_offsets(diameters)
+    angles = featurized_objects[:, is_jar,
+                                FeaturizedObjects._ANGLE_INDEX] * 2 * math.pi
+    directional_offsets = np.stack(
+        [-1 * offsets * np.sin(angles), offsets * np.cos(angles)],
+        axis=-1) / constants.SCENE_WIDTH * direction
+    featurized_objects[:, is_jar, :FeaturizedObjects.
+                       _ANGLE_INDEX] += directional_offsets
     return featurized_objects
 
 
@@ -178,9 +195,6 @@ class FeaturizedObjects():
             f', got {featurized_objects.shape}')
         self.features = featurized_objects
 
-        self.xs = featurized_objects[:, :, self._X_INDEX]
-        self.ys = featurized_objects[:, :, self._Y_INDEX]
-        self.angles = featurized_objects[:, :, self._ANGLE_INDEX]
         self.diameters = featurized_objects[0, :, self._DIAMETER_INDEX]
         self.shapes_one_hot = featurized_objects[0, :, self._SHAPE_START_INDEX:
                                                  self._SHAPE_END_INDEX]
@@ -190,10 +204,33 @@ class FeaturizedObjects():
         self.states = featurized_objects[:, :, self._STATE_START_INDEX:self.
                                          _STATE_END_INDEX]
 
+        # Per feature (T, N) arrays are made contiguous on first access.
+        self._xs = None
+        self._ys = None
+        self._angles = None
         self._shapes = None
         self._colors = None
         self._num_user_inputs = None
 
+    @property
+    def xs(self) -> np.ndarray:
+        if self._xs is None:
+            self._xs = np.ascontiguousarray(self.features[:, :, self._X_INDEX])
+        return self._xs
+
+    @property
+    def ys(self) -> np.ndarray:
+        if self._ys is None:
+            self._ys = np.ascontiguousarray(self.features[:, :, self._Y_INDEX])
+        return self._ys
+
+    @property
+    def angles(self) -> np.ndarray:
+        if self._angles is None:
+            self._angles = np.ascontiguousarray(
+                self.features[:, :, self._ANGLE_INDEX])
+        return self._angles
+
     @property
     def colors(self) -> List[str]:
         if self._colors is None:
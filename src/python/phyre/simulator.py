@@ -12,8 +12,9 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 """A thin wrapper around c++ simulator bindings to handle Thrift objects."""
-from typing import List
-import copy
+from typing import List, Tuple
+import concurrent.futures
+
 import numpy as np
 from thrift import TSerialization
 from thrift.protocol import TBinaryProtocol
@@ -45,25 +46,19 @@ def build_user_input(points=None, rectangulars=None, balls=None):
                                                       balls)
     user_input = scene_if.UserInput(
         flattened_point_list=points.flatten().tolist(), balls=[], polygons=[])
-    for start in range(0, len(rectangulars), 8):
-        rect = rectangulars[start:start + 8]
-        vertices = []
-        for i in range(4):
-            vertices.append(
-                scene_if.Vector(rect[2 * i] - rect[0],
-                                rect[2 * i + 1] - rect[1]))
+    rectangulars = np.asarray(rectangulars, dtype=np.float64).reshape(-1, 4, 2)
+    offsets = (rectangulars - rectangulars[:, :1]).tolist()
+    for (x, y), vertex_offsets in zip(rectangulars[:, 0].tolist(), offsets):
         user_input.polygons.append(
             scene_if.PolygonWithPosition(
-                vertices=vertices,
-                position=scene_if.Vector(rect[0], rect[1]),
+                vertices=[scene_if.Vector(dx, dy) for dx, dy in vertex_offsets],
+                position=scene_if.Vector(x, y),
                 angle=0,
             ))
-    for start in range(0, len(balls), 3):
-        ball = balls[start:start + 3]
+    for x, y, radius in np.reshape(balls, (-1, 3)).tolist():
         user_input.balls.append(
-            scene_if.CircleWithPosition(position=scene_if.Vector(
-                ball[0], ball[1]),
-                                        radius=ball[2]))
+            scene_if.CircleWithPosition(position=scene_if.Vector(x, y),
+                                        radius=radius))
     return user_input
 
 
@@ -134,18 +129,19 @@ def simulate_task_with_input(task,
     if not isinstance(user_input, scene_if.UserInput):
         user_input = build_user_input(*user_input)
 
-    # Creating a shallow copy.
-    task = copy.copy(task)
-    task.scene = add_user_input_to_scene(task.scene, user_input,
-                                         keep_space_around_bodies)
-    return simulate_task(task, steps, stride)
+    # The scene with user input stays on the C++ side.
+    result = simulator_bindings.simulate_task_with_input(
+        serialize(task), serialize(user_input), keep_space_around_bodies, steps,
+        stride)
+    return deserialize(task_if.TaskSimulation(), result)
 
 
 def scene_to_raster(scene: scene_if.Scene) -> np.ndarray:
     """Convert scene to a integer array height x width containing color codes.
     """
     pixels = simulator_bindings.render(serialize(scene))
-    return np.array(pixels).reshape((scene.height, scene.width))
+    # The bindings return a uint8 array. Keep returning the default int dtype.
+    return np.asarray(pixels, dtype=int).reshape((scene.height, scene.width))
 
 
 def scene_to_featurized_objects(scene):
@@ -167,6 +163,15 @@ def _deep_flatten(iterable):
         yield iterable
 
 
+def _flatten_floats(values) -> List[float]:
+    try:
+        flat = np.asarray(values, dtype=np.float64).ravel()
+    except ValueError:
+        # Ragged nesting, e.g., a mix of flat and nested rectangulars.
+        flat = np.fromiter(_deep_flatten(values), dtype=np.float64)
+    return flat.tolist()
+
+
 def _prepare_user_input(points, rectangulars, balls):
     if points is None:
         points = np.empty([0], np.int32)
@@ -179,12 +184,12 @@ def _prepare_user_input(points, rectangulars, balls):
     if rectangulars is None:
         rectangulars = []
     else:
-        rectangulars = tuple(_deep_flatten(rectangulars))
+        rectangulars = _flatten_floats(rectangulars)
         assert len(rectangulars) % 8 == 0
     if balls is None:
         balls = []
     else:
-        balls = tuple(_deep_flatten(balls))
+        balls = _flatten_floats(balls)
         assert len(balls) % 3 == 0
     return points, rectangulars, balls
 
@@ -231,12 +236,26 @@ def magic_ponies(task,
             simulation_time: time spent inside C++ code to unpack and simulate.
             pack_time: time spent inside C++ code to pack the result.
     """
+    return _magic_ponies(*_serialize_task(task),
+                         user_input,
+                         steps=steps,
+                         stride=stride,
+                         keep_space_around_bodies=keep_space_around_bodies,
+                         with_times=with_times,
+                         need_images=need_images,
+                         need_featurized_objects=need_featurized_objects)
+
+
+def _serialize_task(task) -> Tuple[bytes, int, int]:
+    """Returns serialized task and its scene height and width."""
     if isinstance(task, bytes):
-        serialized_task = task
-        height, width = creator.SCENE_HEIGHT, creator.SCENE_WIDTH
-    else:
-        serialized_task = serialize(task)
-        height, width = task.scene.height, task.scene.width
+        return task, creator.SCENE_HEIGHT, creator.SCENE_WIDTH
+    return serialize(task), task.scene.height, task.scene.width
+
+
+def _magic_ponies(serialized_task, height, width, user_input, steps, stride,
+                  keep_space_around_bodies, with_times, need_images,
+                  need_featurized_objects):
     if isinstance(user_input, scene_if.UserInput):
         is_solved, had_occlusions, packed_images, packed_featurized_objects, number_objects, sim_time, pack_time = (
             simulator_bindings.magic_ponies_general(serialized_task,
@@ -253,11 +272,13 @@ def magic_ponies(task,
                                             stride, need_images,
                                             need_featurized_objects))
 
-    packed_images = np.array(packed_images, dtype=np.uint8)
+    # The bindings return a uint8 array, so wrap it instead of copying.
+    packed_images = np.asarray(packed_images, dtype=np.uint8)
 
     images = packed_images.reshape((-1, height, width))
-    packed_featurized_objects = np.array(packed_featurized_objects,
-                                         dtype=np.float32)
+    # The bindings return a float32 array, so wrap it instead of copying.
+    packed_featurized_objects = np.asarray(packed_featurized_objects,
+                                           dtype=np.float32)
     if packed_featurized_objects.size == 0:
         # Custom task without any known objects.
         packed_featurized_objects = np.zeros(
@@ -282,16 +303,27 @@ def batched_magic_ponies(tasks,
                          with_times=False,
                          need_images=False,
                          need_featurized_objects=False):
-    del num_workers  # Not used.
-    return tuple(
-        zip(*[
-            magic_ponies(t,
-                         ui,
-                         steps=steps,
-                         stride=stride,
-                         keep_space_around_bodies=keep_space_around_bodies,
-                         with_times=with_times,
-                         need_images=need_images,
-                         need_featurized_objects=need_featurized_objects)
-            for t, ui in zip(tasks, user_inputs)
-        ]))
+    # Tasks are often repeated in a batch, so serialize each of them once.
+    tasks = list(tasks)
+    serialized_tasks = {}
+    for task in tasks:
+        if id(task) not in serialized_tasks:
+            serialized_tasks[id(task)] = _serialize_task(task)
+
+    def simulate(task, user_input):
+        return _magic_ponies(*serialized_tasks[id(task)],
+                             user_input,
+                             steps=steps,
+                             stride=stride,
+                             keep_space_around_bodies=keep_space_around_bodies,
+                             with_times=with_times,
+                             need_images=need_images,
+                             need_featurized_objects=need_featurized_objects)
+
+    if num_workers > 1:
+        # The bindings release the GIL while simulating.
+        with concurrent.futures.ThreadPoolExecutor(num_workers) as executor:
+            results = list(executor.map(simulate, tasks, user_inputs))
+    else:
+        results = list(map(simulate, tasks, user_inputs))
+    return tuple(zip(*results))
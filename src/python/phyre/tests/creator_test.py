@@ -81,6 +81,21 @@ class ShapesTest(unittest.TestCase):
         diameter = phyre.creator.shapes.compute_shape_diameter(shape)
         self.assertAlmostEqual(diameter, (2**2 + 2**2)**0.5)
 
+    def test_large_polygon_diameter(self):
+        N = 100
+        vertices = []
+        for i in range(N):
+            angle = math.pi * 2 * i / N
+            vertices.append([2 * math.cos(angle), math.sin(angle)])
+        shape = phyre.creator.shapes.vertices_to_polygon(vertices)
+        diameter = phyre.creator.shapes.compute_shape_diameter(shape)
+        self.assertAlmostEqual(diameter, 4.)
+        # Clockwise order is not a valid polygon, but must still work.
+        shape = phyre.creator.shapes.vertices_to_polygon(vertices[::-1],
+                                                         validate=False)
+        diameter = phyre.creator.shapes.compute_shape_diameter(shape)
+        self.assertAlmostEqual(diameter, 4.)
+
     def test_rectange_centroid(self):
         N = 4
         vertices = []
@@ -103,6 +118,16 @@ class ShapesTest(unittest.TestCase):
         self.assertAlmostEqual(centroid[0], 0.)
         self.assertAlmostEqual(centroid[1], 0.)
 
+    def test_union_of_polygons_centroid(self):
+        vertices1 = [(0., 0.), (2., 0.), (2., 2.), (0., 2.)]
+        vertices2 = [(2., 0.), (3., 0.), (3., 2.), (2., 2.)]
+        centroid, mass = (
+            phyre.creator.shapes.compute_union_of_polygons_centroid(
+                [vertices1, vertices2]))
+        self.assertAlmostEqual(centroid[0], 1.5)
+        self.assertAlmostEqual(centroid[1], 1.)
+        self.assertAlmostEqual(mass, 6.)
+
 
 if __name__ == '__main__':
     unittest.main()
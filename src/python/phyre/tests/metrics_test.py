@@ -81,6 +81,22 @@ class ClevrEnvTest(unittest.TestCase):
         print(metrics['independent_solved_by_aucs'][:20])
         self.assertEqual(metrics['independent_solved_by_aucs'][12], num / denom)
 
+    def testComputeMetricsAuccess(self):
+        solved_at = (1, 3, 3, 50, 100)
+        log = []
+        for i, num_attempts in enumerate(solved_at):
+            log.extend([(f'task{i}', -1)] * (num_attempts - 1))
+            log.append((f'task{i}', 1))
+        metrics = phyre.metrics.compute_metrics(log)
+        expected_aucs = [0.]
+        num, denom = 0., 0.
+        for up_to in range(1, phyre.metrics.MAX_TEST_ATTEMPTS + 1):
+            weight = math.log(up_to + 1) - math.log(up_to)
+            num += weight * sum(x <= up_to for x in solved_at)
+            denom += weight
+            expected_aucs.append(num / denom)
+        self.assertEqual(metrics['independent_solved_by_aucs'], expected_aucs)
+
     def testComputeNormalizedMetrics(self):
         evaluator = phyre.metrics.Evaluator(TASKS)
         for i in range(20):
@@ -197,6 +197,18 @@ class SimulationTest(unittest.TestCase):
             np.testing.assert_allclose(simulation.featurized_objects.states,
                                        expected_vectors[:, :, :3])
 
+    def test_finalize_without_jars(self):
+        no_jar_vectors = self.vectors[:, 1:, :]
+        expected_vectors = np.copy(no_jar_vectors)
+        finalized = phyre.simulation.finalize_featurized_objects(no_jar_vectors)
+        self.assertIs(finalized, no_jar_vectors)
+        np.testing.assert_array_equal(finalized, expected_vectors)
+
+    def test_finalize_without_timesteps(self):
+        empty_vectors = np.zeros((0, 4, 14))
+        finalized = phyre.simulation.finalize_featurized_objects(empty_vectors)
+        self.assertEqual(finalized.shape, (0, 4, 14))
+
 
 if __name__ == '__main__':
     unittest.main()
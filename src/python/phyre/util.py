@@ -12,7 +12,9 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import functools
 import hashlib
+import heapq
 
 import numpy as np
 
@@ -42,13 +44,24 @@ def get_solution_path(task_id, solution_id=0):
                f'task{task_id}.solution{solution_id:02d}')
 
 
+def _stable_rng(string, salt=''):
+    string = (str(string) + salt).encode('utf8')
+    return hashlib.md5(string).hexdigest()
+
+
 def stable_shuffle(strings, salt=''):
+    return sorted(strings, key=functools.partial(_stable_rng, salt=salt))
+
 
-    def _stable_rng(string):
-        string = (str(string) + salt).encode('utf8')
-        return hashlib.md5(string).hexdigest()
+def stable_partial_shuffle(strings, num_items, salt=''):
+    """Returns the first num_items elements of stable_shuffle(strings, salt).
 
-    return sorted(strings, key=_stable_rng)
+    Takes O(N log num_items) time and O(num_items) extra memory instead of
+    sorting all the elements.
+    """
+    return heapq.nsmallest(num_items,
+                           strings,
+                           key=functools.partial(_stable_rng, salt=salt))
 
 
 def save_user_input(user_input, fpath):
@@ -232,7 +232,12 @@ class ServiceHandler():
             meta_task.template_params = ' '.join(
                 f'{k}={v}' for k, v in task.template_params.items())
 
-        eval_stats = eval_task_complexity.maybe_load_evaluation(template_id)
+        if self._config['mode'] == DEMO_MODE:
+            # In demo mode eval stats are pre-loaded, so no need to decode the
+            # evaluation file on each request.
+            eval_stats = self.eval_stats.get(template_id)
+        else:
+            eval_stats = eval_task_complexity.maybe_load_evaluation(template_id)
         if eval_stats is not None and eval_stats_has_task(eval_stats, task_id):
             meta_task.eval_data = eval_stats_to_thrift(eval_stats, task_id)
             meta_task.eval_data.known_solutions = filter_known_solutions(
@@ -150,9 +150,14 @@ auto magic_ponies(const py::bytes &serialized_task, const UserInput &user_input,
                   bool need_images, bool need_featurized_objects) {
   SimpleTimer timer;
   Task task = deserialize<Task>(serialized_task);
-  addUserInputToScene(user_input, keep_space_around_bodies,
-                      /*allow_occlusions=*/false, &task.scene);
-  auto simulation = simulateTask(task, steps, stride);
+  TaskSimulation simulation;
+  {
+    // Simulation does not touch Python objects, so let other threads run.
+    py::gil_scoped_release release;
+    addUserInputToScene(user_input, keep_space_around_bodies,
+                        /*allow_occlusions=*/false, &task.scene);
+    simulation = simulateTask(task, steps, stride);
+  }
 
   const double simulation_seconds = timer.GetSeconds();
   const bool isSolved = simulation.isSolution;
@@ -164,22 +169,24 @@ auto magic_ponies(const py::bytes &serialized_task, const UserInput &user_input,
 
   const int imageSize = task.scene.width * task.scene.height;
   uint8_t *packedImages = new uint8_t[imageSize * numImagesTotal];
-  if (numImagesTotal > 0) {
-    int writeIndex = 0;
-    for (const Scene &scene : simulation.sceneList) {
-      renderTo(scene, packedImages + writeIndex);
-      writeIndex += imageSize;
-    }
-  }
-
   const int numSceneObjects = getNumObjects(simulation);
   float *packedVectorizedBodies =
       new float[numSceneObjects * kObjectFeatureSize * numScenesTotal];
-  if (numScenesTotal > 0) {
-    int writeIndex = 0;
-    for (const Scene &scene : simulation.sceneList) {
-      featurizeScene(scene, packedVectorizedBodies + writeIndex);
-      writeIndex += kObjectFeatureSize * numSceneObjects;
+  {
+    py::gil_scoped_release release;
+    if (numImagesTotal > 0) {
+      int writeIndex = 0;
+      for (const Scene &scene : simulation.sceneList) {
+        renderTo(scene, packedImages + writeIndex);
+        writeIndex += imageSize;
+      }
+    }
+    if (numScenesTotal > 0) {
+      int writeIndex = 0;
+      for (const Scene &scene : simulation.sceneList) {
+        featurizeScene(scene, packedVectorizedBodies + writeIndex);
+        writeIndex += kObjectFeatureSize * numSceneObjects;
+      }
     }
   }
 
@@ -278,6 +285,19 @@ PYBIND11_MODULE(simulator_bindings, m) {
       },
       "Produce TaskSimulation");
 
+  m.def(
+      "simulate_task_with_input",
+      [](const py::bytes &serialized_task,
+         const py::bytes &serialized_user_input, bool keep_space_around_bodies,
+         int steps, int stride) {
+        Task task = deserialize<Task>(serialized_task);
+        addUserInputToScene(deserialize<UserInput>(serialized_user_input),
+                            keep_space_around_bodies,
+                            /*allow_occlusions=*/false, &task.scene);
+        return serialize(simulateTask(task, steps, stride));
+      },
+      "Add user input to the task scene and produce TaskSimulation");
+
   m.def(
       "magic_ponies",
       [](const py::bytes &serialized_task, py::array_t<int32_t> points,
@@ -321,8 +341,8 @@ PYBIND11_MODULE(simulator_bindings, m) {
       "render",
       [](const py::bytes &scene) {
         const Scene sceneObj = deserialize<Scene>(scene);
-        std::vector<uint8_t> pixels(sceneObj.width * sceneObj.height);
-        renderTo(sceneObj, pixels.data());
+        py::array_t<uint8_t> pixels(sceneObj.width * sceneObj.height);
+        renderTo(sceneObj, pixels.mutable_data());
         return pixels;
       },
       "Produce Image");